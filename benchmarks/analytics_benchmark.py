@@ -0,0 +1,107 @@
+# benchmarks/analytics_benchmark.py
+"""
+Compare SQLite with the DuckDB snapshot (task-5/analytics_engine.py) on the aggregate
+questions of task-5/sample_queries.txt, at increasing data scales.
+
+For each `--scale` a fresh database is generated with task-5/create_db.py (indexes and
+ANALYZE included), the DuckDB snapshot is loaded from it, and every query runs
+`--repeats` times on each engine. Reports the snapshot load time, median latency per
+engine and the speedup, and checks both engines return the same rows.
+
+    python benchmarks/analytics_benchmark.py --scale 10 100 1000 10000 --repeats 5
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "task-5"))
+from analytics_engine import DuckDBAnalytics
+from create_db import create_indexes, create_schema, seed_data, set_fast_load_pragmas
+from sql_executor import ReadOnlyExecutor
+
+QUERIES = {
+    "top ROI, last 6 months": "SELECT name, roi FROM campaigns WHERE start_date >= '{six_months_ago}' "
+                              "ORDER BY roi DESC, id LIMIT 5",
+    "conversions per channel": "SELECT channel, SUM(conversions) AS total FROM campaigns WHERE spend > 50000 "
+                               "GROUP BY channel ORDER BY total DESC",
+    "urban loyal customers": "SELECT name, loyalty_score, churn_risk FROM customers WHERE region = 'Urban' "
+                             "AND loyalty_score > 80 ORDER BY churn_risk DESC, id LIMIT 100",
+    "converted leads per campaign": "SELECT c.id, MAX(c.name) AS name, COUNT(*) AS converted FROM leads l "
+                                    "JOIN campaigns c ON c.id = l.campaign_id WHERE l.status = 'converted' "
+                                    "GROUP BY c.id ORDER BY converted DESC, c.id LIMIT 100",
+    "social conversions per rupee": "SELECT name, conversions * 1.0 / spend AS per_rupee FROM campaigns "
+                                    "WHERE channel = 'social' ORDER BY per_rupee DESC, id LIMIT 10",
+}
+
+
+def build(path, scale, workers):
+    conn = sqlite3.connect(path)
+    set_fast_load_pragmas(conn)
+    create_schema(conn)
+    counts = seed_data(conn, scale, workers, seed=0)
+    create_indexes(conn)
+    conn.close()
+    return counts
+
+
+def timed(fn, sql_text, repeats):
+    times, result = [], None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn(sql_text)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), result
+
+
+def same_rows(a, b):
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        for u, v in zip(x.values(), y.values()):
+            if isinstance(u, float) or isinstance(v, float):
+                if abs(u - v) > 1e-9 * max(1.0, abs(u)):
+                    return False
+            elif u != v:
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    six_months_ago = time.strftime("%Y-%m-%d", time.localtime(time.time() - 182 * 86400))
+    queries = {name: sql.format(six_months_ago=six_months_ago) for name, sql in QUERIES.items()}
+
+    for scale in args.scale:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            counts = build(path, scale, args.workers)
+            executor = ReadOnlyExecutor(path)
+            started = time.perf_counter()
+            analytics = DuckDBAnalytics(path, connect=executor.connect, background=False)
+            analytics.refresh()
+            load = time.perf_counter() - started
+
+            print(f"\nscale {scale:g}: " + ", ".join(f"{n:,} {table}" for table, n in counts.items())
+                  + f"; DuckDB snapshot loaded in {load:.2f}s")
+            print(f"{'query':<32}{'sqlite ms':>11}{'duckdb ms':>11}{'speedup':>9}{'same':>6}")
+            for name, sql_text in queries.items():
+                sqlite_s, sqlite_result = timed(lambda q: executor.execute_sync(q, timeout=0), sql_text, args.repeats)
+                duck_s, duck_result = timed(lambda q: analytics.execute_sync(q, timeout=0), sql_text, args.repeats)
+                same = same_rows(sqlite_result.rows, duck_result.rows)
+                print(f"{name:<32}{sqlite_s * 1000:>11.1f}{duck_s * 1000:>11.1f}{sqlite_s / duck_s:>8.1f}x"
+                      f"{'yes' if same else 'NO':>6}")
+            executor.close()
+            analytics.con.close()
+
+
+if __name__ == "__main__":
+    main()
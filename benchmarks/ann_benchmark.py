@@ -0,0 +1,110 @@
+# benchmarks/ann_benchmark.py
+"""
+Compare the FAISS index types offered by common/index_factory.py against the exact flat index.
+
+Reports recall@k (overlap with the exact float32 flat index's top-k), mean query latency
+and the serialized index size, including the float16 / 8-bit storage modes. Vectors are
+synthetic clustered embeddings by default, or real MiniLM embeddings of a PDF's chunks
+with --pdf.
+
+    python benchmarks/ann_benchmark.py --n 200000 --queries 1000 --k 10
+    python benchmarks/ann_benchmark.py --pdf brand_manual.pdf --nprobe 4 8 16 32
+"""
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.index_factory import IndexConfig, make_index, set_search_params, training_size
+
+
+def synthetic_vectors(n, dimension, n_clusters=256, seed=0):
+    """Gaussian clusters on the unit sphere, roughly shaped like sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dimension)).astype("float32")
+    labels = rng.integers(0, n_clusters, n)
+    vectors = centers[labels] + 0.35 * rng.standard_normal((n, dimension)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def pdf_vectors(path):
+    from common.embeddings import encode_texts
+    from common.pdf_extraction import iter_pdf_pages
+
+    with open(path, "rb") as f:
+        text = " ".join(text for _, text in iter_pdf_pages(f.read()))
+    words = text.split()
+    chunks = [" ".join(words[i:i + 500]) for i in range(0, len(words), 450)]
+    return encode_texts(chunks, normalize=True)
+
+
+def build(config, vectors):
+    index = make_index(config, vectors.shape[1], len(vectors))
+    started = time.perf_counter()
+    if not index.is_trained:
+        index.train(vectors[:training_size(config, len(vectors))])
+    index.add(vectors)
+    return index, time.perf_counter() - started
+
+
+def evaluate(index, queries, k, truth):
+    started = time.perf_counter()
+    _, found = index.search(queries, k)
+    latency_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    hits = sum(len(set(row) & set(expected)) for row, expected in zip(found, truth))
+    return hits / (len(queries) * k), latency_ms
+
+
+def index_mb(index):
+    return faiss.serialize_index(index).nbytes / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100000, help="synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384, help="synthetic vector dimension (MiniLM is 384)")
+    parser.add_argument("--pdf", help="benchmark on a PDF's chunk embeddings instead")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    args = parser.parse_args()
+
+    vectors = pdf_vectors(args.pdf) if args.pdf else synthetic_vectors(args.n, args.dim)
+    rng = np.random.default_rng(1)
+    # Perturbed corpus points stand in for queries near real content
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype("float32")
+    print(f"corpus={len(vectors)} dim={vectors.shape[1]} queries={len(queries)} k={args.k}\n")
+
+    flat, build_s = build(IndexConfig(index_type="flat"), vectors)
+    _, truth = flat.search(queries, args.k)
+    recall, latency = evaluate(flat, queries, args.k, truth)
+    rows = [("flat", "-", build_s, recall, latency, index_mb(flat))]
+
+    for storage in ("float16", "sq8"):
+        index, build_s = build(IndexConfig(index_type="flat", storage=storage), vectors)
+        recall, latency = evaluate(index, queries, args.k, truth)
+        rows.append(("flat", f"storage={storage}", build_s, recall, latency, index_mb(index)))
+
+    for index_type in ("hnsw", "ivf", "ivfpq"):
+        config = IndexConfig(index_type=index_type)
+        index, build_s = build(config, vectors)
+        knob = "ef_search" if index_type == "hnsw" else "nprobe"
+        for value in (args.ef_search if index_type == "hnsw" else args.nprobe):
+            set_search_params(index, config, nprobe=value, ef_search=value)
+            recall, latency = evaluate(index, queries, args.k, truth)
+            rows.append((index_type, f"{knob}={value}", build_s, recall, latency, index_mb(index)))
+
+    print(f"{'index':<8}{'setting':<16}{'build s':>10}{f'recall@{args.k}':>12}{'ms/query':>11}{'size MB':>10}")
+    for name, setting, build_s, recall, latency, size in rows:
+        print(f"{name:<8}{setting:<16}{build_s:>10.2f}{recall:>12.3f}{latency:>11.3f}{size:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/chunking_benchmark.py
+"""
+Compare the offset-based chunker in common/chunking.py with the original word-join chunker.
+
+Generates a synthetic document (1M words by default) and reports, for each chunk setting,
+the time plus peak and retained Python memory to compute the chunks, and the time to
+materialize every chunk string from the spans (which the RAG pipeline only does one
+embedding batch at a time).
+
+    python benchmarks/chunking_benchmark.py --words 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.chunking import chunk_spans
+
+
+def legacy_chunk_text(text, chunk_size=500, overlap=50):
+    """The chunker task-3/task-4 used before common/chunking.py."""
+    words = text.split()
+    chunks = []
+    for i in range(0, len(words), chunk_size - overlap):
+        chunk = ' '.join(words[i:i+chunk_size])
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+
+def synthetic_text(n_words, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ["campaign", "brand", "ROI", "Q1", "social", "email", "conversion", "audience",
+                  "budget", "SKU-1042", "engagement", "the", "of", "and", "a", "to", "in"]
+    words = [rng.choice(vocabulary) for _ in range(n_words)]
+    # Sprinkle line breaks like extracted PDF text
+    return " ".join(w + ("\n" if i % 12 == 11 else "") for i, w in enumerate(words))
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024), retained / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    text = synthetic_text(args.words)
+    print(f"document: {args.words} words, {len(text) / 1e6:.1f}M characters\n")
+    print(f"{'setting':<12}{'chunker':<10}{'chunks':>9}{'seconds':>10}{'peak MB':>10}{'kept MB':>10}{'materialize s':>15}")
+    for chunk_size, overlap in ((100, 20), (500, 50)):
+        legacy, legacy_s, legacy_peak, legacy_kept = measure(lambda: legacy_chunk_text(text, chunk_size, overlap))
+        spans, spans_s, spans_peak, spans_kept = measure(lambda: chunk_spans(text, chunk_size, overlap))
+        _, materialize_s, _, _ = measure(lambda: spans[:])
+        setting = f"{chunk_size}/{overlap}"
+        print(f"{setting:<12}{'legacy':<10}{len(legacy):>9}{legacy_s:>10.3f}{legacy_peak:>10.1f}{legacy_kept:>10.1f}{'-':>15}")
+        print(f"{setting:<12}{'spans':<10}{len(spans):>9}{spans_s:>10.3f}{spans_peak:>10.1f}{spans_kept:>10.1f}{materialize_s:>15.3f}")
+        assert len(legacy) == len(spans)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Shared helpers used by the RAG, chatbot and summarization tasks.
@@ -0,0 +1,130 @@
+# common/answer_cache.py
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+
+# ----------------------------
+# Configuration
+# ----------------------------
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))
+
+
+def context_hash(context: str) -> str:
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _Entry:
+    scope: str
+    embedding: np.ndarray
+    context_hash: str
+    answer: str
+    created: float
+
+
+class SemanticAnswerCache:
+    """
+    LLM answer cache keyed on a scope (e.g. the documents a question was answered from)
+    plus the question's embedding.
+
+    A new question hits when a cached question in the same scope is within
+    `threshold` cosine similarity *and* the context retrieved for it now has the same hash
+    as when the answer was generated, so answers never outlive the text they came from.
+    Entries expire after `ttl` seconds and the least recently used are evicted past
+    `max_entries`.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl: float = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._scopes: Dict[str, Dict[int, None]] = {}
+        # Per-scope (entry ids, stacked embeddings), rebuilt only after the scope changes
+        self._matrices: Dict[str, tuple] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lookup_seconds = 0.0
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        scope_entries = self._scopes[entry.scope]
+        del scope_entries[entry_id]
+        if not scope_entries:
+            del self._scopes[entry.scope]
+        self._matrices.pop(entry.scope, None)
+
+    def _matrix(self, scope: str):
+        if scope not in self._matrices:
+            ids = list(self._scopes[scope])
+            self._matrices[scope] = (ids, np.stack([self._entries[i].embedding for i in ids]))
+        return self._matrices[scope]
+
+    def lookup(self, scope: str, question_embedding: np.ndarray, context_digest: str) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            with self._lock:
+                if scope not in self._scopes:
+                    self.misses += 1
+                    return None
+                now = time.time()
+                expired = [i for i in self._scopes[scope] if now - self._entries[i].created > self.ttl]
+                for entry_id in expired:
+                    self._remove(entry_id)
+                if scope not in self._scopes:
+                    self.misses += 1
+                    return None
+                ids, matrix = self._matrix(scope)
+                similarities = matrix @ self._normalize(question_embedding)
+                # Best match first; the context check decides among the close ones
+                for position in np.argsort(-similarities):
+                    if similarities[position] < self.threshold:
+                        break
+                    entry = self._entries[ids[position]]
+                    if entry.context_hash == context_digest:
+                        self._entries.move_to_end(ids[position])
+                        self.hits += 1
+                        return entry.answer
+                self.misses += 1
+                return None
+        finally:
+            self._lookup_seconds += time.perf_counter() - started
+
+    def store(self, scope: str, question_embedding: np.ndarray, context_digest: str, answer: str) -> None:
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(scope, self._normalize(question_embedding), context_digest, answer, time.time())
+            self._scopes.setdefault(scope, {})[entry_id] = None
+            self._matrices.pop(scope, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_lookup_ms": 1000 * self._lookup_seconds / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,289 @@
+# common/bm25.py
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Campaign codes, SKUs and emails survive as one token ("sku-1042"), and their parts are
+# indexed too so "1042" alone still matches.
+_TOKEN_RE = re.compile(r"\w+(?:[-_./@]\w+)*")
+
+# Segments are merged once there are more than this many
+MAX_SEGMENTS = 8
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-_./@]", token) if part)
+    return tokens
+
+
+class _Segment:
+    """
+    Immutable block of postings in CSR layout.
+
+    `terms` is the sorted list of term IDs present; the postings of `terms[i]` are
+    `docs[offsets[i]:offsets[i + 1]]` (positions into `chunk_ids`) with frequencies in
+    `tfs`. Storage is ~6 bytes per (term, chunk) pair.
+    """
+
+    __slots__ = ("chunk_ids", "doc_lens", "terms", "offsets", "docs", "tfs")
+
+    def __init__(self, chunk_ids, doc_lens, terms, offsets, docs, tfs):
+        self.chunk_ids = chunk_ids
+        self.doc_lens = doc_lens
+        self.terms = terms
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+
+    @classmethod
+    def build(cls, chunk_ids: np.ndarray, doc_terms: Sequence[np.ndarray]) -> "_Segment":
+        doc_lens = np.array([len(t) for t in doc_terms], dtype=np.int32)
+        all_terms = np.concatenate(doc_terms).astype(np.int64) if len(doc_terms) else np.empty(0, np.int64)
+        all_docs = np.repeat(np.arange(len(doc_terms), dtype=np.int64), doc_lens)
+        # One sort over (term, doc) keys gives both the CSR order and the term frequencies
+        keys, tfs = np.unique(all_terms * len(doc_terms) + all_docs, return_counts=True)
+        return cls._from_sorted(chunk_ids, doc_lens, keys // max(len(doc_terms), 1), keys % max(len(doc_terms), 1), tfs)
+
+    @classmethod
+    def _from_sorted(cls, chunk_ids, doc_lens, posting_terms, posting_docs, tfs) -> "_Segment":
+        terms, starts = np.unique(posting_terms, return_index=True)
+        offsets = np.append(starts, len(posting_terms)).astype(np.int64)
+        return cls(
+            np.asarray(chunk_ids, dtype=np.int64),
+            np.asarray(doc_lens, dtype=np.int32),
+            terms.astype(np.int32),
+            offsets,
+            np.asarray(posting_docs, dtype=np.int32),
+            np.minimum(tfs, np.iinfo(np.uint16).max).astype(np.uint16),
+        )
+
+    def posting_terms(self) -> np.ndarray:
+        return np.repeat(self.terms, np.diff(self.offsets))
+
+    def without(self, chunk_ids: np.ndarray) -> Optional["_Segment"]:
+        """Copy of the segment with the given chunks dropped (None when nothing is left)."""
+        keep_doc = ~np.isin(self.chunk_ids, chunk_ids)
+        if keep_doc.all():
+            return self
+        if not keep_doc.any():
+            return None
+        new_position = np.cumsum(keep_doc) - 1
+        keep = keep_doc[self.docs]
+        return self._from_sorted(
+            self.chunk_ids[keep_doc],
+            self.doc_lens[keep_doc],
+            self.posting_terms()[keep],
+            new_position[self.docs[keep]],
+            self.tfs[keep],
+        )
+
+    @classmethod
+    def merge(cls, segments: List["_Segment"]) -> "_Segment":
+        posting_terms, posting_docs, tfs = [], [], []
+        base = 0
+        for segment in segments:
+            posting_terms.append(segment.posting_terms().astype(np.int64))
+            posting_docs.append(segment.docs.astype(np.int64) + base)
+            tfs.append(segment.tfs)
+            base += len(segment.chunk_ids)
+        posting_terms = np.concatenate(posting_terms)
+        posting_docs = np.concatenate(posting_docs)
+        order = np.lexsort((posting_docs, posting_terms))
+        return cls._from_sorted(
+            np.concatenate([s.chunk_ids for s in segments]),
+            np.concatenate([s.doc_lens for s in segments]),
+            posting_terms[order],
+            posting_docs[order],
+            np.concatenate(tfs)[order],
+        )
+
+    def save(self, path: str) -> None:
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, chunk_ids=self.chunk_ids, doc_lens=self.doc_lens, terms=self.terms,
+                 offsets=self.offsets, docs=self.docs, tfs=self.tfs)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "_Segment":
+        with np.load(path) as data:
+            return cls(data["chunk_ids"], data["doc_lens"], data["terms"], data["offsets"], data["docs"], data["tfs"])
+
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring over knowledge-base chunks.
+
+    Each batch of added chunks (one document) becomes a segment of array-backed postings;
+    small segments are merged as they accumulate. Global statistics (document frequency,
+    chunk count, total length) are kept incrementally, so adds and removals never rescan
+    the corpus. With a `path`, segments are written one file each and only changed ones
+    are rewritten.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.vocabulary: Dict[str, int] = {}
+        self.df = np.zeros(0, dtype=np.int32)
+        self.segments: Dict[int, _Segment] = {}
+        self._next_segment = 0
+        self.n_docs = 0
+        self.total_len = 0
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+
+    # ----------------------------
+    # Persistence
+    # ----------------------------
+    def _vocab_path(self) -> str:
+        return os.path.join(self.path, "vocab.txt")
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.path, f"segment-{segment_id}.npz")
+
+    def _load(self) -> None:
+        if os.path.exists(self._vocab_path()):
+            with open(self._vocab_path(), "r", encoding="utf-8") as f:
+                for line in f:
+                    self.vocabulary[line.rstrip("\n")] = len(self.vocabulary)
+        self.df = np.zeros(len(self.vocabulary), dtype=np.int32)
+        for name in os.listdir(self.path):
+            match = re.fullmatch(r"segment-(\d+)\.npz", name)
+            if match:
+                segment_id = int(match.group(1))
+                self._attach(segment_id, _Segment.load(os.path.join(self.path, name)))
+                self._next_segment = max(self._next_segment, segment_id + 1)
+
+    def _write_segment(self, segment_id: int) -> None:
+        if self.path:
+            self.segments[segment_id].save(self._segment_path(segment_id))
+
+    def _drop_segment_file(self, segment_id: int) -> None:
+        if self.path and os.path.exists(self._segment_path(segment_id)):
+            os.remove(self._segment_path(segment_id))
+
+    # ----------------------------
+    # Updates
+    # ----------------------------
+    def _term_ids(self, tokens: Iterable[str], grow: bool) -> np.ndarray:
+        ids = []
+        new_terms = []
+        for token in tokens:
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                if not grow:
+                    continue
+                term_id = self.vocabulary[token] = len(self.vocabulary)
+                new_terms.append(token)
+            ids.append(term_id)
+        if new_terms and self.path:
+            with open(self._vocab_path(), "a", encoding="utf-8") as f:
+                f.writelines(term + "\n" for term in new_terms)
+        return np.array(ids, dtype=np.int64)
+
+    def _attach(self, segment_id: int, segment: _Segment) -> None:
+        if len(self.df) < len(self.vocabulary):
+            self.df = np.concatenate([self.df, np.zeros(len(self.vocabulary) - len(self.df), dtype=np.int32)])
+        self.df[segment.terms] += np.diff(segment.offsets).astype(np.int32)
+        self.n_docs += len(segment.chunk_ids)
+        self.total_len += int(segment.doc_lens.sum())
+        self.segments[segment_id] = segment
+
+    def _detach(self, segment_id: int) -> _Segment:
+        segment = self.segments.pop(segment_id)
+        self.df[segment.terms] -= np.diff(segment.offsets).astype(np.int32)
+        self.n_docs -= len(segment.chunk_ids)
+        self.total_len -= int(segment.doc_lens.sum())
+        return segment
+
+    def add(self, chunk_ids: Sequence[int], texts: Iterable[str]) -> None:
+        """Index chunks under their knowledge-base IDs."""
+        with self._lock:
+            doc_terms = [self._term_ids(tokenize(text), grow=True) for text in texts]
+            if not doc_terms:
+                return
+            segment_id = self._next_segment
+            self._next_segment += 1
+            self._attach(segment_id, _Segment.build(np.asarray(chunk_ids, dtype=np.int64), doc_terms))
+            self._write_segment(segment_id)
+            if len(self.segments) > MAX_SEGMENTS:
+                self._merge_smallest()
+
+    def remove(self, chunk_ids: Sequence[int]) -> None:
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        with self._lock:
+            for segment_id in list(self.segments):
+                if not np.isin(self.segments[segment_id].chunk_ids, chunk_ids).any():
+                    continue
+                remaining = self._detach(segment_id).without(chunk_ids)
+                if remaining is None:
+                    self._drop_segment_file(segment_id)
+                else:
+                    self._attach(segment_id, remaining)
+                    self._write_segment(segment_id)
+
+    def _merge_smallest(self) -> None:
+        by_size = sorted(self.segments, key=lambda s: len(self.segments[s].docs))
+        to_merge = by_size[:len(self.segments) - MAX_SEGMENTS // 2 + 1]
+        merged = _Segment.merge([self._detach(segment_id) for segment_id in to_merge])
+        for segment_id in to_merge:
+            self._drop_segment_file(segment_id)
+        segment_id = self._next_segment
+        self._next_segment += 1
+        self._attach(segment_id, merged)
+        self._write_segment(segment_id)
+
+    # ----------------------------
+    # Search
+    # ----------------------------
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """Top-k `(chunk_id, bm25_score)` pairs for the query."""
+        with self._lock:
+            if not self.n_docs:
+                return []
+            query_terms = np.unique(self._term_ids(tokenize(query), grow=False))
+            if not len(query_terms):
+                return []
+            df = self.df[query_terms].astype(np.float64)
+            idf = np.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+            avg_len = self.total_len / self.n_docs
+            candidates: List[Tuple[float, int]] = []
+            for segment in self.segments.values():
+                positions = np.searchsorted(segment.terms, query_terms)
+                docs, weights = [], []
+                for term, position, term_idf in zip(query_terms, positions, idf):
+                    if position >= len(segment.terms) or segment.terms[position] != term:
+                        continue
+                    start, end = segment.offsets[position], segment.offsets[position + 1]
+                    d = segment.docs[start:end]
+                    tf = segment.tfs[start:end].astype(np.float32)
+                    norm = self.k1 * (1 - self.b + self.b * segment.doc_lens[d] / avg_len)
+                    docs.append(d)
+                    weights.append(term_idf * tf * (self.k1 + 1) / (tf + norm))
+                if not docs:
+                    continue
+                scores = np.bincount(np.concatenate(docs), weights=np.concatenate(weights), minlength=len(segment.chunk_ids))
+                top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+                candidates.extend((float(scores[i]), int(segment.chunk_ids[i])) for i in top if scores[i] > 0)
+        candidates.sort(reverse=True)
+        return [(chunk_id, score) for score, chunk_id in candidates[:k]]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked ID lists: score(id) = sum over lists of 1 / (k + rank), best first."""
+    scores: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,116 @@
+# common/chunking.py
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+# Lookup table of every code point str.split() treats as whitespace (none lie above U+3000)
+_MAX_SPACE = 0x3000
+_IS_SPACE = np.array([chr(c).isspace() for c in range(_MAX_SPACE + 2)], dtype=bool)
+
+PAGE_SEPARATOR = "\n"
+
+
+class Chunks:
+    """
+    Chunk boundaries as character offsets into one shared text.
+
+    Nothing is copied until a chunk is read: `chunks[i]` slices the text on demand and
+    `chunks[a:b]` returns a list of strings for that range (e.g. one embedding batch).
+    """
+
+    def __init__(self, text: str, starts: np.ndarray, ends: np.ndarray, pages: Optional[np.ndarray] = None):
+        self.text = text
+        self.starts = starts
+        self.ends = ends
+        self.pages = pages
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(i, slice):
+            return [self.text[s:e] for s, e in zip(self.starts[i].tolist(), self.ends[i].tolist())]
+        return self.text[self.starts[i]:self.ends[i]]
+
+    def __iter__(self):
+        for s, e in zip(self.starts.tolist(), self.ends.tolist()):
+            yield self.text[s:e]
+
+    def page(self, i: int) -> Optional[int]:
+        return None if self.pages is None else int(self.pages[i])
+
+
+def word_offsets(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Start and end character offsets of every whitespace-separated word, computed with NumPy."""
+    codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    # Clipping maps every code point above the table to a non-space slot
+    is_space = _IS_SPACE[np.minimum(codes, _MAX_SPACE + 1)]
+    # A word starts where a non-space follows a space (or the text start) and ends the other way round
+    edges = np.diff(np.concatenate(([True], is_space, [True])).astype(np.int8))
+    starts = np.flatnonzero(edges == -1)
+    ends = np.flatnonzero(edges == 1)
+    return starts, ends
+
+
+def _window_spans(unit_starts: np.ndarray, unit_ends: np.ndarray, size: int, overlap: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Character spans of windows of `size` units (words or tokens) advancing by `size - overlap`."""
+    if size <= overlap:
+        raise ValueError("chunk_size must be larger than overlap.")
+    n = len(unit_starts)
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    first = np.arange(0, n, size - overlap)
+    last = np.minimum(first + size, n) - 1
+    return unit_starts[first], unit_ends[last]
+
+
+def chunk_spans(text: str, chunk_size: int = 500, overlap: int = 50) -> Chunks:
+    """Same windows as the old `' '.join(words[i:i+chunk_size])` chunker, as offsets into `text`."""
+    starts, ends = _window_spans(*word_offsets(text), chunk_size, overlap)
+    return Chunks(text, starts, ends)
+
+
+def token_offsets(text: str, tokenizer) -> Tuple[np.ndarray, np.ndarray]:
+    """Character offsets of every token from a Hugging Face fast tokenizer."""
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+    offsets = np.asarray(encoding["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+    return offsets[:, 0], offsets[:, 1]
+
+
+def chunk_token_spans(text: str, tokenizer, max_tokens: int, overlap: int = 32) -> Chunks:
+    """Windows of at most `max_tokens` model tokens, so no chunk is truncated by the embedder."""
+    starts, ends = _window_spans(*token_offsets(text, tokenizer), max_tokens, overlap)
+    return Chunks(text, starts, ends)
+
+
+def chunk_pages(
+    pages: Iterable[Tuple[int, str]],
+    chunk_size: int = 500,
+    overlap: int = 50,
+    tokenizer=None,
+) -> Chunks:
+    """
+    Chunk a sequence of `(page_number, text)` pages.
+
+    Windows run across page breaks; each chunk is tagged with the page its first word (or
+    token) came from. Sizes are in words, or in tokens when a `tokenizer` is given.
+    """
+    page_numbers: List[int] = []
+    page_starts: List[int] = []
+    parts: List[str] = []
+    offset = 0
+    for page_number, page_text in pages:
+        page_numbers.append(page_number)
+        page_starts.append(offset)
+        parts.append(page_text)
+        offset += len(page_text) + len(PAGE_SEPARATOR)
+    text = PAGE_SEPARATOR.join(parts)
+
+    if tokenizer is not None:
+        chunks = chunk_token_spans(text, tokenizer, chunk_size, overlap)
+    else:
+        chunks = chunk_spans(text, chunk_size, overlap)
+    if page_numbers:
+        page_index = np.searchsorted(np.asarray(page_starts), chunks.starts, side="right") - 1
+        chunks.pages = np.asarray(page_numbers)[page_index]
+    return chunks
@@ -0,0 +1,98 @@
+# common/conversational_rag.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Tuple
+
+from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT, QA_PROMPT
+from langchain_core.messages import get_buffer_string
+from langchain_core.prompts import PromptTemplate
+
+from common.retrievers import chunk_to_document
+
+# Rewrites of the question searched alongside it
+QUERY_VARIANTS = int(os.getenv("QUERY_VARIANTS", "3"))
+
+# Same instructions as LangChain's MultiQueryRetriever prompt, plus the conversation, so the
+# variants can be generated from the raw follow-up question at the same time as it is condensed
+VARIANTS_PROMPT = PromptTemplate(
+    input_variables=["question", "chat_history", "n"],
+    template="""You are an AI language model assistant. Your task is to generate {n} different versions of the given user question to retrieve relevant documents from a vector database. By generating multiple perspectives on the user question, your goal is to help the user overcome some of the limitations of the distance-based similarity search. Use the conversation, if any, to resolve what the question refers to, so that every version stands on its own. Provide these alternative questions separated by newlines.
+
+Conversation:
+{chat_history}
+
+Original question: {question}""",
+)
+
+# LLM calls of one turn run on these threads; the calls are network-bound
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_CONCURRENCY", "8")), thread_name_prefix="llm")
+
+
+class ConversationalRAG:
+    """
+    Conversational question answering over a shared `KnowledgeBase`.
+
+    Does what `ConversationalRetrievalChain` over a `MultiQueryRetriever` did, with less
+    waiting per turn: the follow-up question is condensed and the query variants are
+    generated concurrently (both only need the question and the history), and the
+    condensed question plus every variant are embedded and searched in one batch with
+    `kb.search_many`. Called like the chain: `rag({"question": ...})` returns a dict with
+    `answer`, `source_documents` and `generated_question`; `stream` yields the answer as
+    it is generated.
+    """
+
+    def __init__(self, kb: Any, llm: Any, memory: Any, k: int = 3, n_variants: int = QUERY_VARIANTS):
+        self.kb = kb
+        self.llm = llm
+        self.memory = memory
+        self.k = k
+        self.n_variants = n_variants
+
+    def condense_question(self, question: str, chat_history: str) -> str:
+        if not chat_history:
+            return question
+        return self.llm.invoke(CONDENSE_QUESTION_PROMPT.format(question=question, chat_history=chat_history)).strip()
+
+    def generate_variants(self, question: str, chat_history: str) -> List[str]:
+        if self.n_variants <= 0:
+            return []
+        text = self.llm.invoke(VARIANTS_PROMPT.format(question=question, chat_history=chat_history, n=self.n_variants))
+        return [line.strip() for line in text.splitlines() if line.strip()][:self.n_variants]
+
+    def retrieve(self, question: str, chat_history: str = ""):
+        """`(standalone_question, documents)` for the question in the context of the history."""
+        variants = _executor.submit(self.generate_variants, question, chat_history)
+        standalone = self.condense_question(question, chat_history)
+        chunks = self.kb.search_many([standalone] + variants.result(), self.k)
+        return standalone, [chunk_to_document(chunk) for chunk in chunks]
+
+    def stream(self, inputs: Dict[str, str]) -> Tuple[Dict[str, Any], Iterator[str]]:
+        """
+        Retrieve now and return `(result, tokens)`: `result` already holds the question,
+        standalone question and sources; iterating `tokens` streams the answer, after which
+        `result["answer"]` is set and the turn is saved to memory (once, on completion).
+        """
+        question = inputs["question"]
+        chat_history = self.memory.load_memory_variables({"question": question})[self.memory.memory_key]
+        if not isinstance(chat_history, str):
+            # Message-list memories (return_messages=True)
+            chat_history = get_buffer_string(chat_history)
+        standalone, documents = self.retrieve(question, chat_history)
+        context = "\n\n".join(doc.page_content for doc in documents)
+        result = {"question": question, "generated_question": standalone, "answer": None, "source_documents": documents}
+
+        def tokens() -> Iterator[str]:
+            parts = []
+            for chunk in self.llm.stream(QA_PROMPT.format(context=context, question=standalone)):
+                text = getattr(chunk, "content", chunk)
+                parts.append(text)
+                yield text
+            result["answer"] = "".join(parts)
+            self.memory.save_context({"question": question}, {"answer": result["answer"]})
+        return result, tokens()
+
+    def __call__(self, inputs: Dict[str, str]) -> Dict[str, Any]:
+        result, tokens = self.stream(inputs)
+        for _ in tokens:
+            pass
+        return result
@@ -0,0 +1,96 @@
+# common/embeddings.py
+import atexit
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Ingestion settings: chunks per streamed batch, worker processes (1 = no pool),
+# and the document size below which starting a worker pool is not worth its start-up cost.
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", str(os.cpu_count() or 1)))
+EMBEDDING_POOL_MIN_CHUNKS = int(os.getenv("EMBEDDING_POOL_MIN_CHUNKS", "2000"))
+
+# (chunks done, total chunks, seconds elapsed)
+ProgressCallback = Callable[[int, int, float], None]
+
+
+@lru_cache(maxsize=None)
+def get_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL) -> SentenceTransformer:
+    """Load a SentenceTransformer once per process and hand out the same instance afterwards."""
+    return SentenceTransformer(model_name)
+
+
+def encode_texts(texts: Sequence[str], model_name: str = DEFAULT_EMBEDDING_MODEL, normalize: bool = False) -> np.ndarray:
+    """Encode texts into a float32 matrix ready for FAISS (unit-length rows when `normalize`)."""
+    embeddings = get_embedding_model(model_name).encode(
+        list(texts), convert_to_numpy=True, normalize_embeddings=normalize
+    )
+    # The model already returns contiguous float32, so this is a no-copy view
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+
+_pools: Dict[str, dict] = {}
+_pools_lock = threading.Lock()
+
+
+def get_multi_process_pool(model_name: str = DEFAULT_EMBEDDING_MODEL, workers: int = EMBEDDING_WORKERS) -> Optional[dict]:
+    """Start (once) a sentence-transformers multi-process pool with one CPU worker per core."""
+    if workers <= 1:
+        return None
+    with _pools_lock:
+        if model_name not in _pools:
+            model = get_embedding_model(model_name)
+            _pools[model_name] = model.start_multi_process_pool(target_devices=["cpu"] * workers)
+        return _pools[model_name]
+
+
+@atexit.register
+def _stop_pools() -> None:
+    for pool in _pools.values():
+        SentenceTransformer.stop_multi_process_pool(pool)
+    _pools.clear()
+
+
+def iter_embedding_batches(
+    texts: Sequence[str],
+    model_name: str = DEFAULT_EMBEDDING_MODEL,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    workers: int = EMBEDDING_WORKERS,
+    progress_callback: Optional[ProgressCallback] = None,
+    normalize: bool = False,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Encode texts in batches of `batch_size`, yielding `(offset, float32 matrix)` per batch.
+
+    Large inputs are fanned out over the multi-process pool batch by batch, so callers can
+    add vectors to an index while the rest of the document is still being encoded.
+    """
+    total = len(texts)
+    model = get_embedding_model(model_name)
+    pool = get_multi_process_pool(model_name, workers) if total >= EMBEDDING_POOL_MIN_CHUNKS else None
+    if pool is not None:
+        # Give every worker a full batch per round trip
+        batch_size = batch_size * workers
+    started = time.perf_counter()
+    for offset in range(0, total, batch_size):
+        batch = list(texts[offset:offset + batch_size])
+        if pool is not None:
+            embeddings = model.encode_multi_process(
+                batch, pool, chunk_size=max(1, len(batch) // workers), normalize_embeddings=normalize
+            )
+        else:
+            embeddings = model.encode(
+                batch, batch_size=min(len(batch), 64), convert_to_numpy=True, normalize_embeddings=normalize
+            )
+        yield offset, np.ascontiguousarray(embeddings, dtype=np.float32)
+        # Reported after the caller has consumed (e.g. indexed) the batch
+        if progress_callback is not None:
+            progress_callback(offset + len(batch), total, time.perf_counter() - started)
+
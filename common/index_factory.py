@@ -0,0 +1,164 @@
+# common/index_factory.py
+import math
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+METRICS = ("cosine", "l2")
+STORAGE_TYPES = ("float32", "float16", "sq8")
+
+# Scalar-quantizer codes for the reduced-precision storage modes (2x and 4x smaller than float32)
+_SQ_TYPES = {"float16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+
+
+@dataclass(frozen=True)
+class IndexConfig:
+    """
+    How `build_faiss_index` lays out vectors.
+
+    - flat:  exact brute-force scan (IndexFlatIP / IndexFlatL2), best for a single brochure.
+    - hnsw:  graph index (IndexHNSWFlat), no training, tuned with `ef_search`.
+    - ivf:   inverted lists over k-means cells (IndexIVFFlat), tuned with `nprobe`.
+    - ivfpq: IVF with product-quantized codes (IndexIVFPQ), smallest memory footprint.
+
+    `nlist=0` picks roughly 4 * sqrt(n) cells for the corpus being indexed.
+
+    `metric="cosine"` normalizes embeddings once at ingestion (and each query) and searches
+    by inner product, which is what all-MiniLM-L6-v2 is trained for. `storage` keeps the
+    vectors as float32, float16 or 8-bit scalar-quantized codes; it does not apply to
+    ivfpq, whose codes are already compressed.
+    """
+
+    index_type: str = "flat"
+    metric: str = "cosine"
+    storage: str = "float32"
+    nlist: int = 0
+    nprobe: int = 16
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    ef_search: int = 64
+    pq_m: int = 48
+    pq_bits: int = 8
+    train_sample: int = 50000
+
+    @classmethod
+    def from_env(cls) -> "IndexConfig":
+        return cls(
+            index_type=os.getenv("FAISS_INDEX_TYPE", "flat").lower(),
+            metric=os.getenv("FAISS_METRIC", "cosine").lower(),
+            storage=os.getenv("FAISS_STORAGE", "float32").lower(),
+            nlist=int(os.getenv("FAISS_NLIST", "0")),
+            nprobe=int(os.getenv("FAISS_NPROBE", "16")),
+            hnsw_m=int(os.getenv("FAISS_HNSW_M", "32")),
+            ef_construction=int(os.getenv("FAISS_EF_CONSTRUCTION", "200")),
+            ef_search=int(os.getenv("FAISS_EF_SEARCH", "64")),
+            pq_m=int(os.getenv("FAISS_PQ_M", "48")),
+            pq_bits=int(os.getenv("FAISS_PQ_BITS", "8")),
+            train_sample=int(os.getenv("FAISS_TRAIN_SAMPLE", "50000")),
+        )
+
+    @property
+    def normalize(self) -> bool:
+        return self.metric == "cosine"
+
+    @property
+    def faiss_metric(self) -> int:
+        return faiss.METRIC_INNER_PRODUCT if self.normalize else faiss.METRIC_L2
+
+
+def resolve_nlist(config: IndexConfig, n_vectors: int) -> int:
+    if config.nlist:
+        return config.nlist
+    return max(1, int(4 * math.sqrt(max(n_vectors, 1))))
+
+
+def needs_training(config: IndexConfig) -> bool:
+    return config.index_type in ("ivf", "ivfpq") or config.storage == "sq8"
+
+
+def min_training_points(config: IndexConfig, n_vectors: int) -> int:
+    """Fewest vectors IVF/IVF-PQ can be trained on: one per cell, and for ivfpq one per PQ centroid (2**pq_bits)."""
+    if config.index_type == "ivf":
+        return resolve_nlist(config, n_vectors)
+    if config.index_type == "ivfpq":
+        return max(resolve_nlist(config, n_vectors), 2 ** config.pq_bits)
+    return 0
+
+
+def uses_flat_fallback(config: IndexConfig, n_vectors: int) -> bool:
+    """True when an IVF/IVF-PQ layout is requested but `n_vectors` is too few to train it."""
+    return config.index_type in ("ivf", "ivfpq") and n_vectors < min_training_points(config, n_vectors)
+
+
+def training_size(config: IndexConfig, n_vectors: int) -> int:
+    """Vectors to collect before training: ~39 points per cell/centroid (FAISS's lower bound), capped by the sample size."""
+    if not needs_training(config) or uses_flat_fallback(config, n_vectors):
+        return 0
+    sample = min(config.train_sample, n_vectors)
+    if config.index_type in ("ivf", "ivfpq"):
+        sample = max(39 * min_training_points(config, n_vectors), sample)
+    return min(n_vectors, sample)
+
+
+def _flat_index(config: IndexConfig, dimension: int) -> faiss.Index:
+    if config.storage in _SQ_TYPES:
+        return faiss.IndexScalarQuantizer(dimension, _SQ_TYPES[config.storage], config.faiss_metric)
+    if config.normalize:
+        return faiss.IndexFlatIP(dimension)
+    return faiss.IndexFlatL2(dimension)
+
+
+def make_index(config: IndexConfig, dimension: int, n_vectors: int) -> faiss.Index:
+    """Create an empty index for `n_vectors` vectors of `dimension`, falling back to flat when too small to train."""
+    if config.index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type '{config.index_type}'. Expected one of {INDEX_TYPES}.")
+    if config.metric not in METRICS:
+        raise ValueError(f"Unknown FAISS metric '{config.metric}'. Expected one of {METRICS}.")
+    if config.storage not in STORAGE_TYPES:
+        raise ValueError(f"Unknown FAISS storage '{config.storage}'. Expected one of {STORAGE_TYPES}.")
+
+    nlist = resolve_nlist(config, n_vectors)
+    if config.index_type == "flat" or uses_flat_fallback(config, n_vectors):
+        return _flat_index(config, dimension)
+
+    metric = config.faiss_metric
+    if config.index_type == "hnsw":
+        if config.storage in _SQ_TYPES:
+            index = faiss.IndexHNSWSQ(dimension, _SQ_TYPES[config.storage], config.hnsw_m, metric)
+        else:
+            index = faiss.IndexHNSWFlat(dimension, config.hnsw_m, metric)
+        index.hnsw.efConstruction = config.ef_construction
+    elif config.index_type == "ivf":
+        quantizer = faiss.IndexFlatIP(dimension) if config.normalize else faiss.IndexFlatL2(dimension)
+        if config.storage in _SQ_TYPES:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, _SQ_TYPES[config.storage], metric)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+    else:
+        if dimension % config.pq_m:
+            raise ValueError(f"FAISS_PQ_M={config.pq_m} must divide the embedding dimension {dimension}.")
+        quantizer = faiss.IndexFlatIP(dimension) if config.normalize else faiss.IndexFlatL2(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, config.pq_m, config.pq_bits, metric)
+    set_search_params(index, config)
+    return index
+
+
+def train_index(index: faiss.Index, sample: np.ndarray) -> None:
+    if not index.is_trained:
+        index.train(sample)
+
+
+def set_search_params(index: faiss.Index, config: IndexConfig, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """Apply query-time knobs (`nprobe` for IVF, `efSearch` for HNSW); a no-op for flat indexes."""
+    # Knowledge bases wrap HNSW (and older ones IVF-PQ) in an IndexIDMap2
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe or config.nprobe
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search or config.ef_search
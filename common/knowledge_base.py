@@ -0,0 +1,493 @@
+# common/knowledge_base.py
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, replace
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from common.bm25 import BM25Index, reciprocal_rank_fusion
+from common.chunking import Chunks, chunk_pages
+from common.embeddings import DEFAULT_EMBEDDING_MODEL, ProgressCallback, encode_texts, get_embedding_model
+from common.index_factory import IndexConfig, min_training_points, set_search_params
+from common.pdf_extraction import iter_pdf_pages
+from common.vector_index import build_faiss_index
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------
+# Configuration
+# ----------------------------
+KNOWLEDGE_BASE_DIR = os.getenv(
+    "KNOWLEDGE_BASE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "marketing-chatbot", "kb"),
+)
+# Disk budget per knowledge base; least recently used documents are removed past it
+KNOWLEDGE_BASE_MAX_MB = int(os.getenv("KNOWLEDGE_BASE_MAX_MB", "2048"))
+# IVF indexes are retrained once the corpus has grown this many times past the vectors they were trained on
+KB_RETRAIN_GROWTH = float(os.getenv("KB_RETRAIN_GROWTH", "4"))
+
+# "words" keeps the historical word windows; "tokens" sizes chunks with the embedding
+# model's own tokenizer so nothing is cut off at its 256-token limit
+CHUNK_UNIT = os.getenv("CHUNK_UNIT", "words")
+
+# "hybrid" fuses FAISS and BM25 rankings, "dense" / "sparse" use one of them
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Candidates taken from each ranking before fusion, as a multiple of k
+FUSION_CANDIDATES = int(os.getenv("FUSION_CANDIDATES", "4"))
+
+INDEX_FILE = "index.faiss"
+METADATA_FILE = "metadata.db"
+SETTINGS_FILE = "settings.json"
+BM25_DIR = "bm25"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    added_at REAL,
+    last_used REAL,
+    page_count INTEGER,
+    chunk_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    document_id TEXT REFERENCES documents(id) ON DELETE CASCADE,
+    page INTEGER,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(document_id);
+"""
+
+
+def _wrapped_ivfpq(index: faiss.Index) -> bool:
+    """IVF-PQ inside an IndexIDMap2, as older knowledge bases built it: its `remove_ids` aborts the process."""
+    return isinstance(index, faiss.IndexIDMap2) and isinstance(faiss.downcast_index(index.index), faiss.IndexIVFPQ)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+class KnowledgeBase:
+    """
+    Persistent multi-document corpus: one ID-mapped FAISS index, a BM25 inverted index
+    over the same chunks, and a SQLite chunk store.
+
+    Chunk IDs in the index are the `chunks.id` rows, so documents are appended with
+    `add_with_ids` and dropped with `remove_ids` without touching anyone else's vectors.
+    Index types that cannot delete vectors (HNSW) keep them as tombstones: their
+    metadata rows are gone and search skips them. A single instance is meant to be
+    shared by every session of the app (see `st.cache_resource` in the tasks).
+
+    Chunking parameters, model and index layout are fixed when the knowledge base is
+    first created and read back from `settings.json` afterwards; only the query-time
+    knobs (`nprobe`, `ef_search`) follow the config (or environment) given on each load.
+    The index itself is not: while the corpus is too small to train the configured
+    IVF/IVF-PQ layout it is flat, and it is re-embedded into the trained layout once
+    the corpus crosses that threshold, then retrained each time it grows `retrain_growth` times past the
+    vectors it was trained on (so centroids never stay fitted to the first document).
+
+    The directory is kept under `max_bytes`: after each addition the least recently
+    used documents (by search hits and additions) are removed until it fits.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        root_dir: str = KNOWLEDGE_BASE_DIR,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        chunk_size: int = 500,
+        overlap: int = 50,
+        config: Optional[IndexConfig] = None,
+        chunk_unit: str = CHUNK_UNIT,
+        max_bytes: int = KNOWLEDGE_BASE_MAX_MB * 1024 * 1024,
+        retrain_growth: float = KB_RETRAIN_GROWTH,
+    ):
+        self.path = os.path.join(root_dir, name)
+        os.makedirs(self.path, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.retrain_growth = retrain_growth
+        self._lock = threading.RLock()
+        # Serializes index writers (additions, removals, rebuilds); searches only take `_lock`
+        self._ingest_lock = threading.RLock()
+        # document ID -> last search hit, written to the documents table before eviction
+        self._last_used: Dict[str, float] = {}
+        self._tombstones = False
+        requested = config or IndexConfig.from_env()
+        self.settings = self._load_settings(
+            {
+                "model_name": model_name,
+                "chunk_size": chunk_size,
+                "overlap": overlap,
+                "chunk_unit": chunk_unit,
+                "index": asdict(requested),
+            }
+        )
+        stored = IndexConfig(**self.settings["index"])
+        if requested.index_type != stored.index_type:
+            logger.warning(
+                "Knowledge base '%s' was built as a %s index; ignoring the requested %s layout",
+                name, stored.index_type, requested.index_type,
+            )
+        self.config = replace(stored, nprobe=requested.nprobe, ef_search=requested.ef_search)
+        self.db = sqlite3.connect(os.path.join(self.path, METADATA_FILE), check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+        if "last_used" not in {r["name"] for r in self.db.execute("PRAGMA table_info(documents)")}:
+            # Knowledge bases created before eviction existed
+            self.db.execute("ALTER TABLE documents ADD COLUMN last_used REAL")
+            self.db.execute("UPDATE documents SET last_used = added_at")
+            self.db.commit()
+        index_path = os.path.join(self.path, INDEX_FILE)
+        self.index = faiss.read_index(index_path) if os.path.exists(index_path) else None
+        if self.index is not None:
+            set_search_params(self.index, self.config)
+            self.settings.setdefault("trained_on", self.index.ntotal)
+        self.bm25 = BM25Index(os.path.join(self.path, BM25_DIR))
+        if self.bm25.n_docs == 0:
+            # Knowledge bases created before the sparse index existed
+            rows = self.db.execute("SELECT id, text FROM chunks ORDER BY id").fetchall()
+            if rows:
+                self.bm25.add([r["id"] for r in rows], (r["text"] for r in rows))
+
+    def _load_settings(self, defaults: dict) -> dict:
+        settings_path = os.path.join(self.path, SETTINGS_FILE)
+        if os.path.exists(settings_path):
+            with open(settings_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        with open(settings_path, "w", encoding="utf-8") as f:
+            json.dump(defaults, f, indent=2)
+        return defaults
+
+    def _save_settings(self) -> None:
+        settings_path = os.path.join(self.path, SETTINGS_FILE)
+        tmp = f"{settings_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.settings, f, indent=2)
+        os.replace(tmp, settings_path)
+
+    def _save_index(self) -> None:
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if self.index is None:
+            if os.path.exists(index_path):
+                os.remove(index_path)
+            return
+        tmp = f"{index_path}.tmp"
+        faiss.write_index(self.index, tmp)
+        os.replace(tmp, index_path)
+
+    def _chunk(self, pages) -> Chunks:
+        chunk_size, overlap = self.settings["chunk_size"], self.settings["overlap"]
+        if self.settings.get("chunk_unit", "words") != "tokens":
+            return chunk_pages(pages, chunk_size, overlap)
+        model = get_embedding_model(self.settings["model_name"])
+        # Leave room for the [CLS]/[SEP] tokens the model adds
+        max_tokens = min(chunk_size, model.max_seq_length - 2)
+        return chunk_pages(pages, max_tokens, min(overlap, max_tokens // 4), tokenizer=model.tokenizer)
+
+    # ----------------------------
+    # Documents
+    # ----------------------------
+    @staticmethod
+    def document_id(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def has_document(self, document_id: str) -> bool:
+        with self._lock:
+            return self.db.execute("SELECT 1 FROM documents WHERE id = ?", (document_id,)).fetchone() is not None
+
+    def list_documents(self) -> List[Dict]:
+        with self._lock:
+            rows = self.db.execute("SELECT * FROM documents ORDER BY added_at").fetchall()
+        return [dict(r) for r in rows]
+
+    def add_pdf(self, name: str, data: bytes, progress_callback: Optional[ProgressCallback] = None) -> str:
+        """Add a PDF to the corpus (a no-op if the same bytes were already added) and return its ID."""
+        document_id = self.document_id(data)
+        if self.has_document(document_id):
+            self._touch([document_id])
+            return document_id
+        page_count = 0
+
+        def counted_pages():
+            nonlocal page_count
+            for page in iter_pdf_pages(data):
+                page_count += 1
+                yield page
+
+        # Pages stream from the extractor straight into the chunker
+        chunks = self._chunk(counted_pages())
+        if not len(chunks):
+            raise ValueError("No text chunks to index. Please check your PDF or chunking logic.")
+
+        with self._ingest_lock:
+            self._add_chunks(document_id, name, page_count, chunks, progress_callback)
+            self._evict(keep=document_id)
+            if self._needs_rebuild():
+                self.rebuild_index(progress_callback)
+        return document_id
+
+    def _add_chunks(self, document_id: str, name: str, page_count: int, chunks: Chunks,
+                    progress_callback: Optional[ProgressCallback]) -> None:
+        with self._lock:
+            if self.has_document(document_id):
+                return
+            now = time.time()
+            self.db.execute(
+                "INSERT INTO documents (id, name, added_at, last_used, page_count, chunk_count) VALUES (?,?,?,?,?,?)",
+                (document_id, name, now, now, page_count, len(chunks)),
+            )
+            self.db.executemany(
+                "INSERT INTO chunks (document_id, page, text) VALUES (?,?,?)",
+                [(document_id, chunks.page(i), text) for i, text in enumerate(chunks)],
+            )
+            ids = np.array(
+                [r[0] for r in self.db.execute("SELECT id FROM chunks WHERE document_id = ? ORDER BY id", (document_id,))],
+                dtype=np.int64,
+            )
+            self.db.commit()
+
+        try:
+            self.bm25.add(ids, chunks)
+            created = False
+            with self._lock:
+                if self.index is None:
+                    # The first document creates (and, for IVF, trains) the index
+                    self.index = build_faiss_index(
+                        chunks, self.settings["model_name"], progress_callback, self.config, ids=ids
+                    )
+                    self.settings["trained_on"] = len(chunks)
+                    self._save_settings()
+                    created = True
+            if not created:
+                # Later documents are encoded without blocking searches
+                build_faiss_index(
+                    chunks, self.settings["model_name"], progress_callback, self.config,
+                    index=self.index, ids=ids, lock=self._lock,
+                )
+            with self._lock:
+                self._save_index()
+        except Exception:
+            self.remove_document(document_id)
+            raise
+
+    def remove_document(self, document_id: str) -> None:
+        with self._ingest_lock, self._lock:
+            ids = np.array(
+                [r[0] for r in self.db.execute("SELECT id FROM chunks WHERE document_id = ?", (document_id,))],
+                dtype=np.int64,
+            )
+            if self.index is not None and len(ids):
+                try:
+                    if _wrapped_ivfpq(self.index):
+                        raise RuntimeError("remove_ids is unsafe on this index")
+                    self.index.remove_ids(ids)
+                except RuntimeError:
+                    # Index type without deletion support: leave tombstoned vectors behind
+                    self._tombstones = True
+                self._save_index()
+            self.bm25.remove(ids)
+            self.db.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+            self.db.commit()
+            self._last_used.pop(document_id, None)
+
+    # ----------------------------
+    # Index maintenance
+    # ----------------------------
+    def _needs_rebuild(self) -> bool:
+        if self.index is None or self.config.index_type not in ("ivf", "ivfpq"):
+            return False
+        if _wrapped_ivfpq(self.index):
+            return True
+        with self._lock:
+            n_chunks = self.db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        if faiss.try_extract_index_ivf(self.index) is None:
+            # Still the flat fallback the first (small) documents were indexed with
+            return n_chunks >= min_training_points(self.config, n_chunks)
+        return n_chunks >= self.retrain_growth * max(self.settings.get("trained_on", 0), 1)
+
+    def rebuild_index(self, progress_callback: Optional[ProgressCallback] = None) -> None:
+        """
+        Re-embed every stored chunk into a fresh index laid out (and trained) for the
+        current corpus. Searches keep using the old index until the new one is swapped in.
+        """
+        with self._ingest_lock:
+            with self._lock:
+                rows = self.db.execute("SELECT id, text FROM chunks ORDER BY id").fetchall()
+            index = None
+            if rows:
+                ids = np.array([r["id"] for r in rows], dtype=np.int64)
+                logger.info("Rebuilding the %s index of %s over %d chunks", self.config.index_type, self.path, len(ids))
+                index = build_faiss_index(
+                    [r["text"] for r in rows], self.settings["model_name"], progress_callback, self.config, ids=ids
+                )
+            with self._lock:
+                self.index = index
+                self._tombstones = False
+                self.settings["trained_on"] = len(rows)
+                self._save_settings()
+                self._save_index()
+
+    def _touch(self, document_ids) -> None:
+        now = time.time()
+        with self._lock:
+            for document_id in document_ids:
+                self._last_used[document_id] = now
+
+    def _evict(self, keep: str) -> None:
+        """Remove least recently used documents (never `keep`) until the directory fits in `max_bytes`."""
+        total = _dir_size(self.path)
+        if total <= self.max_bytes:
+            return
+        with self._lock:
+            self.db.executemany(
+                "UPDATE documents SET last_used = ? WHERE id = ?",
+                [(used, document_id) for document_id, used in self._last_used.items()],
+            )
+            self.db.commit()
+            self._last_used.clear()
+            documents = self.db.execute(
+                "SELECT id, name, chunk_count FROM documents WHERE id != ? ORDER BY last_used", (keep,)
+            ).fetchall()
+            n_chunks = self.db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        # Space is freed roughly in proportion to a document's chunks (vectors, postings, text)
+        bytes_per_chunk = total / max(n_chunks, 1)
+        evicted = []
+        for document in documents:
+            if total <= self.max_bytes:
+                break
+            self.remove_document(document["id"])
+            total -= bytes_per_chunk * document["chunk_count"]
+            evicted.append(document["name"])
+        if not evicted:
+            return
+        with self._lock:
+            # Hand the freed pages back to the file system
+            self.db.execute("VACUUM")
+        if self._tombstones:
+            # HNSW cannot delete vectors: compact it so the evicted ones stop taking space
+            self.rebuild_index()
+        logger.info("Knowledge base %s over %d MB: evicted %s", self.path, self.max_bytes // (1024 * 1024), evicted)
+
+    # ----------------------------
+    # Retrieval
+    # ----------------------------
+    def embed_query(self, query: str) -> np.ndarray:
+        """Query embedding as used for dense search, reusable by callers (e.g. answer caching)."""
+        return encode_texts([query], self.settings["model_name"], normalize=self.config.normalize)
+
+    def search(
+        self, query: str, k: int = 5, mode: str = RETRIEVAL_MODE, query_embedding: Optional[np.ndarray] = None
+    ) -> List[Dict]:
+        """
+        Top-k chunks for the query as dicts with id, text, source, page and score.
+
+        In hybrid mode the FAISS and BM25 rankings are fused with reciprocal-rank fusion
+        and `score` is the fused score; otherwise it is the similarity (or BM25 score) of
+        the single ranking used. Pass `query_embedding` from `embed_query` to skip re-encoding.
+        """
+        n_candidates = k * FUSION_CANDIDATES
+        dense_ranking = None
+        if mode in ("hybrid", "dense"):
+            dense_ranking = self._dense_ranking(query, n_candidates, query_embedding)
+        ranked = self._ranking(query, n_candidates, mode, dense_ranking)
+
+        with self._lock:
+            found = self._chunks_by_id([chunk_id for chunk_id, _ in ranked])
+        results = self._top_chunks(ranked, found, k)
+        self._touch({chunk["document_id"] for chunk in results})
+        return results
+
+    def search_many(self, queries: List[str], k: int = 5, mode: str = RETRIEVAL_MODE) -> List[Dict]:
+        """
+        Union of the top-k chunks of several queries (e.g. rewrites of one question), without duplicates.
+
+        All queries are embedded in one batch and looked up with one multi-row FAISS search.
+        Each query's top-k is ranked as in `search`; the per-query lists are then fused with
+        reciprocal-rank fusion, so chunks found by several queries come first and `score`
+        is that fused score.
+        """
+        queries = list(dict.fromkeys(q.strip() for q in queries if q and q.strip()))
+        if not queries:
+            return []
+        n_candidates = k * FUSION_CANDIDATES
+        dense_rankings = [None] * len(queries)
+        if mode in ("hybrid", "dense"):
+            dense_rankings = self._dense_rankings(queries, n_candidates)
+        per_query = [
+            self._ranking(query, n_candidates, mode, dense_ranking)
+            for query, dense_ranking in zip(queries, dense_rankings)
+        ]
+
+        with self._lock:
+            found = self._chunks_by_id(list({chunk_id for ranked in per_query for chunk_id, _ in ranked}))
+        top_ids = [[chunk["id"] for chunk in self._top_chunks(ranked, found, k)] for ranked in per_query]
+        results = [{**found[chunk_id], "score": score} for chunk_id, score in reciprocal_rank_fusion(top_ids)]
+        self._touch({chunk["document_id"] for chunk in results})
+        return results
+
+    def _ranking(
+        self, query: str, n: int, mode: str, dense_ranking: Optional[List[Tuple[int, float]]]
+    ) -> List[Tuple[int, float]]:
+        rankings = []
+        if mode in ("hybrid", "dense"):
+            rankings.append(dense_ranking)
+        if mode in ("hybrid", "sparse"):
+            rankings.append(self.bm25.search(query, n))
+        if len(rankings) == 1:
+            return rankings[0]
+        return reciprocal_rank_fusion([[chunk_id for chunk_id, _ in ranking] for ranking in rankings])
+
+    @staticmethod
+    def _top_chunks(ranked: List[Tuple[int, float]], found: Dict[int, Dict], k: int) -> List[Dict]:
+        results = []
+        for chunk_id, score in ranked:
+            # Chunks of removed documents (tombstoned vectors) have no metadata row
+            chunk = found.get(chunk_id)
+            if chunk is not None:
+                results.append({**chunk, "score": float(score)})
+            if len(results) == k:
+                break
+        return results
+
+    def _dense_ranking(self, query: str, n: int, query_embedding: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        return self._dense_rankings([query], n, query_embedding)[0]
+
+    def _dense_rankings(
+        self, queries: List[str], n: int, query_embeddings: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[int, float]]]:
+        if self.index is None:
+            return [[] for _ in queries]
+        if query_embeddings is None:
+            query_embeddings = encode_texts(queries, self.settings["model_name"], normalize=self.config.normalize)
+        with self._lock:
+            scores, ids = self.index.search(query_embeddings, n)
+        return [
+            [(int(i), float(score)) for i, score in zip(row_ids, row_scores) if i != -1]
+            for row_ids, row_scores in zip(ids, scores)
+        ]
+
+    def _chunks_by_id(self, chunk_ids: List[int]) -> Dict[int, Dict]:
+        if not chunk_ids:
+            return {}
+        placeholders = ",".join("?" * len(chunk_ids))
+        rows = self.db.execute(
+            f"SELECT c.id, c.text, c.page, c.document_id, d.name AS source FROM chunks c JOIN documents d ON d.id = c.document_id "
+            f"WHERE c.id IN ({placeholders})",
+            chunk_ids,
+        ).fetchall()
+        return {r["id"]: dict(r) for r in rows}
@@ -0,0 +1,250 @@
+# common/memory.py
+import logging
+import os
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from common.bm25 import BM25Index
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------
+# Configuration
+# ----------------------------
+# Hard cap on the history put into a prompt, in tokens
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "1500"))
+# Latest turns kept word for word
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "4"))
+# Share of the budget for the running summary of older turns
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+# Older turns brought back because they match the new message
+MEMORY_RELEVANT_TURNS = int(os.getenv("MEMORY_RELEVANT_TURNS", "2"))
+# Summary LLM calls running at once across all memories (each memory has at most one in flight)
+MEMORY_SUMMARY_CONCURRENCY = int(os.getenv("MEMORY_SUMMARY_CONCURRENCY", "4"))
+# tiktoken encoding; gpt2 is what CharacterTextSplitter.from_tiktoken_encoder counts with (task-6)
+MEMORY_TOKEN_ENCODING = os.getenv("MEMORY_TOKEN_ENCODING", "gpt2")
+
+SUMMARY_PROMPT = """Progressively summarize the lines of conversation provided, adding onto the previous summary and returning a new summary in at most {max_words} words. Keep every figure, campaign name and decision the conversation relied on.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
+
+SUMMARY_HEADER = "Summary of earlier conversation:"
+RELEVANT_HEADER = "Relevant earlier exchanges:"
+
+_summary_slots = threading.BoundedSemaphore(MEMORY_SUMMARY_CONCURRENCY)
+
+
+@lru_cache(maxsize=None)
+def _encoding(name: str):
+    import tiktoken
+    return tiktoken.get_encoding(name)
+
+
+def count_tokens(text: str, encoding: str = MEMORY_TOKEN_ENCODING) -> int:
+    return len(_encoding(encoding).encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, encoding: str = MEMORY_TOKEN_ENCODING) -> str:
+    """The first `max_tokens` tokens of `text`."""
+    tokens = _encoding(encoding).encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else _encoding(encoding).decode(tokens[:max(max_tokens, 0)])
+
+
+def _header_tokens() -> int:
+    # Section headers and separators, reserved up front so the rendered text stays in budget
+    return count_tokens(f"{SUMMARY_HEADER}\n\n\n{RELEVANT_HEADER}\n\n\n")
+
+
+class TokenBudgetMemory:
+    """
+    Conversation memory whose prompt share never exceeds `max_tokens`.
+
+    Drop-in for the `ConversationBufferMemory` calls the chatbots make
+    (`load_memory_variables` / `save_context` / `clear`). The history it renders is made
+    of, in the order the budget is spent on them:
+
+    - a running summary of the older turns, at most `summary_tokens` long,
+    - the last `recent_turns` turns verbatim (newest first if they do not all fit),
+    - up to `relevant_turns` older turns that best match the new message (BM25).
+
+    Turns leaving the verbatim window are folded into the summary by the LLM on a
+    background (daemon) thread, so saving a turn never waits on a summary call. Each
+    memory runs at most one summary at a time; turns that leave the window meanwhile
+    are coalesced into its next call, so a busy session never queues more than one
+    summary, and at most `MEMORY_SUMMARY_CONCURRENCY` summaries run process-wide.
+    """
+
+    def __init__(
+        self,
+        llm: Any,
+        memory_key: str = "history",
+        input_key: Optional[str] = None,
+        output_key: Optional[str] = None,
+        max_tokens: int = MEMORY_MAX_TOKENS,
+        recent_turns: int = MEMORY_RECENT_TURNS,
+        summary_tokens: int = MEMORY_SUMMARY_TOKENS,
+        relevant_turns: int = MEMORY_RELEVANT_TURNS,
+        human_prefix: str = "Human",
+        ai_prefix: str = "AI",
+    ):
+        self.llm = llm
+        self.memory_key = memory_key
+        self.input_key = input_key
+        self.output_key = output_key
+        self.max_tokens = max_tokens
+        self.recent_turns = recent_turns
+        self.summary_tokens = min(summary_tokens, max_tokens)
+        self.relevant_turns = relevant_turns
+        self.human_prefix = human_prefix
+        self.ai_prefix = ai_prefix
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._summarizing = False
+        self._summary_idle = threading.Event()
+        self._summary_idle.set()
+        self.clear()
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.turns: List[Tuple[str, str]] = []
+            self.summary = ""
+            # Turns before this index are in the summary
+            self._summarized = 0
+            self._index = BM25Index()
+            # Bumped on clear so a summary finishing afterwards is dropped
+            self._generation += 1
+
+    # ----------------------------
+    # ConversationBufferMemory interface
+    # ----------------------------
+    @staticmethod
+    def _pick(values: Dict[str, Any], key: Optional[str]) -> str:
+        if key is not None:
+            return str(values[key])
+        return str(next(iter(values.values()))) if values else ""
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, Any]) -> None:
+        question = self._pick(inputs, self.input_key)
+        answer = self._pick(outputs, self.output_key)
+        with self._lock:
+            self.turns.append((question, answer))
+            self._index.add([len(self.turns) - 1], [f"{question}\n{answer}"])
+            first_recent = max(len(self.turns) - self.recent_turns, 0)
+            if first_recent > self._summarized and not self._summarizing:
+                self._summarizing = True
+                self._summary_idle.clear()
+                # Daemon, so pending summaries never hold up interpreter exit
+                threading.Thread(target=self._summarize_pending, name="memory-summary", daemon=True).start()
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, str]:
+        query = self._pick(inputs, self.input_key) if inputs else ""
+        return {self.memory_key: self.render(query)}
+
+    # ----------------------------
+    # Rendering
+    # ----------------------------
+    def _format_turn(self, turn: Tuple[str, str]) -> str:
+        question, answer = turn
+        return f"{self.human_prefix}: {question}\n{self.ai_prefix}: {answer}"
+
+    def render(self, query: str = "") -> str:
+        with self._lock:
+            turns = list(self.turns)
+            summary = self.summary
+            first_recent = max(len(turns) - self.recent_turns, 0)
+            matches = self._index.search(query, self.relevant_turns + self.recent_turns) if query else []
+        relevant = [turn_id for turn_id, _ in matches if turn_id < first_recent][:self.relevant_turns]
+
+        budget = self.max_tokens - _header_tokens()
+        summary = truncate_tokens(summary, self.summary_tokens) if summary else ""
+        budget -= count_tokens(summary)
+
+        recent: List[str] = []
+        for turn in reversed(turns[first_recent:]):
+            text = self._format_turn(turn)
+            cost = count_tokens(text) + 1
+            if cost > budget:
+                # Newest turn always gets in, cut to what is left
+                if not recent and budget > 0:
+                    recent.append(truncate_tokens(text, budget - 1))
+                    budget = 0
+                break
+            recent.append(text)
+            budget -= cost
+        recent.reverse()
+
+        earlier: List[str] = []
+        for turn_id in sorted(relevant):
+            text = self._format_turn(turns[turn_id])
+            cost = count_tokens(text) + 1
+            if cost <= budget:
+                earlier.append(text)
+                budget -= cost
+
+        sections = []
+        if summary:
+            sections.append(f"{SUMMARY_HEADER}\n{summary}")
+        if earlier:
+            sections.append(f"{RELEVANT_HEADER}\n" + "\n".join(earlier))
+        if recent:
+            sections.append("\n".join(recent))
+        return "\n\n".join(sections)
+
+    # ----------------------------
+    # Summarization
+    # ----------------------------
+    def _summarize_pending(self) -> None:
+        """Fold every turn that has left the verbatim window into the summary, one LLM call per round."""
+        try:
+            while True:
+                with self._lock:
+                    first_recent = max(len(self.turns) - self.recent_turns, 0)
+                    if first_recent <= self._summarized:
+                        self._summarizing = False
+                        self._summary_idle.set()
+                        return
+                    turns = self.turns[self._summarized:first_recent]
+                    summary, generation = self.summary, self._generation
+                with _summary_slots:
+                    new_summary = self._summarize(summary, turns)
+                with self._lock:
+                    if generation != self._generation:
+                        # Cleared meanwhile: start over from the new turns
+                        continue
+                    # On failure the turns are skipped too; they stay reachable through relevance search
+                    self._summarized += len(turns)
+                    if new_summary is not None:
+                        self.summary = truncate_tokens(new_summary, self.summary_tokens)
+        except BaseException:
+            with self._lock:
+                self._summarizing = False
+                self._summary_idle.set()
+            raise
+
+    def _summarize(self, summary: str, turns: List[Tuple[str, str]]) -> Optional[str]:
+        prompt = SUMMARY_PROMPT.format(
+            max_words=max(self.summary_tokens * 3 // 4, 20),
+            summary=summary or "(none)",
+            new_lines="\n".join(self._format_turn(turn) for turn in turns),
+        )
+        try:
+            result = self.llm.invoke(prompt)
+        except Exception:
+            logger.warning("Conversation summary failed; %d turns left out of it", len(turns), exc_info=True)
+            return None
+        return str(getattr(result, "content", result)).strip()
+
+    def wait_for_summary(self, timeout: Optional[float] = None) -> bool:
+        """Block until this memory's pending summaries are written (tests, shutdown); False on timeout."""
+        return self._summary_idle.wait(timeout)
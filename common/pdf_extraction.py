@@ -0,0 +1,147 @@
+# common/pdf_extraction.py
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+from PyPDF2 import PdfReader
+
+# ----------------------------
+# Configuration
+# ----------------------------
+PDF_TEXT_CACHE_DIR = os.getenv(
+    "PDF_TEXT_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "marketing-chatbot", "pdf-text"),
+)
+# Least recently read files are evicted once the text cache grows past this
+PDF_TEXT_CACHE_MAX_MB = int(os.getenv("PDF_TEXT_CACHE_MAX_MB", "512"))
+# Files with fewer pages are extracted in-process; starting workers costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+# Pages handed to a worker per task
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+Page = Tuple[int, str]
+
+# Set once per worker process by the pool initializer, so the PDF bytes are sent once per worker
+_worker_reader: Optional[PdfReader] = None
+
+
+def _init_worker(data: bytes) -> None:
+    global _worker_reader
+    _worker_reader = PdfReader(io.BytesIO(data))
+
+
+def _extract_range(page_range: Tuple[int, int]) -> List[str]:
+    start, end = page_range
+    return [_worker_reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def read_bytes(file: Union[bytes, BinaryIO]) -> bytes:
+    """Bytes of a PDF given as bytes, a path-less file object, or a Streamlit/FastAPI upload."""
+    if isinstance(file, bytes):
+        return file
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    return file.read()
+
+
+def _evict_text_cache(max_bytes: int = PDF_TEXT_CACHE_MAX_MB * 1024 * 1024) -> None:
+    entries = []
+    total = 0
+    for name in os.listdir(PDF_TEXT_CACHE_DIR):
+        if not name.endswith(".jsonl"):
+            continue
+        path = os.path.join(PDF_TEXT_CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+    entries.sort()
+    # Always keep the most recently used file, even if it alone exceeds the budget
+    while total > max_bytes and len(entries) > 1:
+        _, size, path = entries.pop(0)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _iter_extracted(data: bytes, workers: int) -> Iterator[Page]:
+    reader = PdfReader(io.BytesIO(data))
+    page_count = len(reader.pages)
+    if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        for number, page in enumerate(reader.pages, start=1):
+            yield number, page.extract_text() or ""
+        return
+
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count)) for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+    # spawn, not fork: callers may already run FAISS/torch threads, which do not survive a fork
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(ranges)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(data,),
+    ) as pool:
+        # map() yields in submission order, so pages come out in document order
+        for (start, _), texts in zip(ranges, pool.map(_extract_range, ranges)):
+            for offset, text in enumerate(texts):
+                yield start + offset + 1, text
+
+
+def iter_pdf_pages(file: Union[bytes, BinaryIO], workers: int = PDF_WORKERS, use_cache: bool = True) -> Iterator[Page]:
+    """
+    Yield `(page_number, text)` for every page of a PDF, numbered from 1.
+
+    Large files are extracted across a process pool. Extracted text is cached on disk by
+    the SHA-256 of the file, so re-reading the same PDF (in any task) skips parsing; the
+    cache is kept under `PDF_TEXT_CACHE_MAX_MB`, least recently read files first out.
+    """
+    data = read_bytes(file)
+    cache_path = os.path.join(PDF_TEXT_CACHE_DIR, hashlib.sha256(data).hexdigest() + ".jsonl")
+    if use_cache and os.path.exists(cache_path):
+        try:
+            now = time.time()
+            os.utime(cache_path, (now, now))
+            f = open(cache_path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            # Evicted in between; extract again below
+            pass
+        else:
+            with f:
+                for line in f:
+                    number, text = json.loads(line)
+                    yield number, text
+            return
+
+    if not use_cache:
+        yield from _iter_extracted(data, workers)
+        return
+
+    os.makedirs(PDF_TEXT_CACHE_DIR, exist_ok=True)
+    # Unique per thread too: the same PDF can be extracted by two sessions at once
+    tmp_path = f"{cache_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for number, text in _iter_extracted(data, workers):
+                f.write(json.dumps([number, text]) + "\n")
+                yield number, text
+        # Only a fully extracted file becomes a cache entry
+        os.replace(tmp_path, cache_path)
+        _evict_text_cache()
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_pdf_text(file: Union[bytes, BinaryIO]) -> str:
+    """Full text of a PDF, for callers that do not need page numbers."""
+    return "".join(text for _, text in iter_pdf_pages(file))
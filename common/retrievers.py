@@ -0,0 +1,11 @@
+# common/retrievers.py
+from langchain_core.documents import Document
+
+
+def chunk_to_document(chunk: dict) -> Document:
+    """LangChain Document for a knowledge-base search hit, keeping source/page for citations."""
+    return Document(
+        page_content=chunk["text"],
+        metadata={"chunk_id": chunk["id"], "source": chunk["source"], "page": chunk["page"], "score": chunk["score"]},
+    )
+
@@ -0,0 +1,78 @@
+# common/vector_index.py
+import threading
+from contextlib import nullcontext
+from typing import List, Optional, Sequence
+
+import faiss
+import numpy as np
+
+from common.embeddings import DEFAULT_EMBEDDING_MODEL, ProgressCallback, iter_embedding_batches
+from common.index_factory import IndexConfig, make_index, train_index, training_size
+
+
+def build_faiss_index(
+    chunks: Sequence[str],
+    model_name: str = DEFAULT_EMBEDDING_MODEL,
+    progress_callback: Optional[ProgressCallback] = None,
+    config: Optional[IndexConfig] = None,
+    index: Optional[faiss.Index] = None,
+    ids: Optional[np.ndarray] = None,
+    lock: Optional[threading.RLock] = None,
+) -> faiss.Index:
+    """
+    Embed chunks batch by batch and add each batch to the index as soon as it is encoded.
+
+    Index types that need training (IVF/IVF-PQ) buffer the first batches until the
+    training sample is complete, train on it, and then continue streaming. Pass an
+    existing `index` to append to it, and `ids` (int64, one per chunk) to add through
+    `add_with_ids`; a new non-IVF index is then wrapped in an `IndexIDMap2` (IVF indexes
+    store IDs themselves, and `remove_ids` through the wrapper aborts on IVF-PQ). When the
+    index is shared with readers, `lock` is held only while each batch is added, not while encoding.
+    """
+    if not len(chunks):
+        raise ValueError("No text chunks to index. Please check your PDF or chunking logic.")
+    config = config or IndexConfig.from_env()
+    n_vectors = len(chunks)
+    pending: List[np.ndarray] = []
+    pending_rows = 0
+    for offset, embeddings in iter_embedding_batches(
+        chunks, model_name, progress_callback=progress_callback, normalize=config.normalize
+    ):
+        if embeddings.ndim == 1:
+            raise ValueError("Embedding model returned 1D embeddings. Check input chunks.")
+        if index is None:
+            index = make_index(config, embeddings.shape[1], n_vectors)
+            if ids is not None and faiss.try_extract_index_ivf(index) is None:
+                index = faiss.IndexIDMap2(index)
+        if index.is_trained:
+            _add(index, embeddings, ids, offset, lock)
+            continue
+        pending.append(embeddings)
+        pending_rows += len(embeddings)
+        if pending_rows >= training_size(config, n_vectors):
+            buffered = np.concatenate(pending)
+            train_index(index, buffered)
+            _add(index, buffered, ids, offset + len(embeddings) - len(buffered), lock)
+            pending, pending_rows = [], 0
+    return index
+
+
+def _add(index: faiss.Index, embeddings: np.ndarray, ids: Optional[np.ndarray], offset: int, lock=None) -> None:
+    with lock or nullcontext():
+        if ids is None:
+            index.add(embeddings)
+        else:
+            index.add_with_ids(embeddings, ids[offset:offset + len(embeddings)])
+
+
+def streamlit_progress(label: str = "Embedding chunks"):
+    """Progress callback that renders chunks done and throughput in a Streamlit progress bar."""
+    import streamlit as st
+
+    bar = st.progress(0.0, text=label)
+
+    def report(done: int, total: int, elapsed: float) -> None:
+        rate = done / elapsed if elapsed > 0 else 0.0
+        bar.progress(done / total, text=f"{label}: {done}/{total} ({rate:.0f} chunks/s)")
+
+    return report
@@ -0,0 +1,127 @@
+# task-1/chat_server.py
+"""
+Multi-session Gradio server for the marketing chatbot.
+
+Every browser session gets its own conversation memory (kept in a bounded `SessionStore`
+with idle eviction), and replies are streamed with `astream` as Gemini generates them, so
+one process serves many concurrent chats instead of one worker per request.
+
+    python chat_server.py
+"""
+import os
+
+import gradio as gr
+from dotenv import load_dotenv
+
+# Before importing the bot module, which reads its settings from the environment
+load_dotenv()
+from marketing_chatbot import MarketingChatBot, SessionStore
+
+# Concurrent chats served at once; requests beyond this wait in Gradio's queue
+CHAT_CONCURRENCY = int(os.getenv("CHAT_CONCURRENCY", "64"))
+
+# Custom CSS for better UI
+custom_css = """
+.gradio-container {
+    max-height: none !important;
+}
+footer {
+    display: none !important;
+}
+#chatbot {
+    height: 500px !important;
+    max-height: 500px !important;
+    overflow-y: auto !important;
+}
+#input-box {
+    max-height: none !important;
+}
+"""
+
+
+def build_demo(bot, sessions):
+    """Gradio Blocks app answering each browser session from its own memory."""
+
+    async def respond(message, chat_history, request: gr.Request):
+        """Function to handle user input and stream the response into the chat"""
+        if not message.strip():
+            yield "", chat_history
+            return
+
+        # Append to chat history and clear the input box right away
+        chat_history = chat_history + [(message, "")]
+        yield "", chat_history
+
+        # Stream the bot response, answered from this session's memory
+        memory = sessions.get(request.session_hash)
+        bot_message = ""
+        async for piece in bot.astream_response(message, memory):
+            bot_message += piece
+            chat_history[-1] = (message, bot_message)
+            yield "", chat_history
+
+    def clear(request: gr.Request):
+        sessions.drop(request.session_hash)
+        return []
+
+    # Create the custom Gradio interface with submit button
+    with gr.Blocks(title="Marketing Analytics Chatbot", css=custom_css) as demo:
+        gr.Markdown("# 🎯 Marketing Analytics Chatbot")
+        gr.Markdown("Ask about campaign performance, engagement trends, and marketing analytics!")
+
+        # Create chatbot display
+        chatbot = gr.Chatbot(
+            label="Conversation",
+            height=400,
+            show_copy_button=True,
+            elem_id="chatbot"
+        )
+
+        # Create input area with submit button
+        with gr.Row():
+            msg = gr.Textbox(
+                label="Your Message",
+                placeholder="Type your marketing question here...",
+                lines=2,
+                max_lines=10,
+                scale=8,
+                elem_id="input-box",
+                submit_btn=True
+            )
+            clear_btn = gr.Button("Clear", variant="secondary", scale=1, min_width=100)
+
+        # Example questions
+        gr.Examples(
+            examples=[
+                "Summarize last quarter's customer engagement trends",
+                "Compare email performance between last quarter and holiday season",
+                "What was the ROI for Q1 campaigns?",
+                "Suggest improvements for our social media strategy"
+            ],
+            inputs=msg,
+            label="Example Questions (Click to insert)"
+        )
+
+        # Set up event handlers
+        msg.submit(
+            respond,
+            [msg, chatbot],
+            [msg, chatbot]
+        )
+
+        clear_btn.click(
+            clear,
+            None,
+            chatbot,
+            queue=False
+        )
+
+    # Async handlers share the event loop, so many chats can wait on Gemini at once
+    demo.queue(default_concurrency_limit=CHAT_CONCURRENCY)
+    return demo
+
+
+if __name__ == "__main__":
+    bot = MarketingChatBot()
+    sessions = SessionStore(bot.new_memory)
+    build_demo(bot, sessions).launch()
@@ -0,0 +1,85 @@
+# task-1/load_test.py
+"""
+Load test for the multi-session chatbot, with a fake LLM standing in for Gemini.
+
+Each simulated user is its own session and sends `--turns` messages one after another;
+all users run at once on one event loop through `MarketingChatBot.aget_response`. The
+fake model sleeps `--latency` seconds per call (asyncio.sleep when awaited), so
+throughput should grow with the number of users until CPU work dominates, where a
+serialized server would stay at 1 / latency replies per second.
+
+    python load_test.py --latency 0.5 --users 1 4 16 64
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from marketing_chatbot import MarketingChatBot, SessionStore
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model answering after a fixed delay, without any network call."""
+
+    latency: float = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-latency"
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"Reply to {len(messages[-1].content)} chars."))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+
+async def run_user(bot, sessions, user, turns, latencies):
+    for turn in range(turns):
+        started = time.perf_counter()
+        await bot.aget_response(f"User {user}: how did campaign {turn} perform?", sessions.get(f"user-{user}"))
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_load(bot, users, turns):
+    sessions = SessionStore(bot.new_memory)
+    latencies: List[float] = []
+    started = time.perf_counter()
+    await asyncio.gather(*(run_user(bot, sessions, user, turns, latencies) for user in range(users)))
+    return time.perf_counter() - started, latencies, len(sessions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per fake LLM call")
+    args = parser.parse_args()
+
+    bot = MarketingChatBot(llm=FakeChatModel(latency=args.latency))
+    serialized = 1 / args.latency
+    print(f"fake LLM latency {args.latency:.2f}s; a serialized server tops out at {serialized:.1f} replies/s\n")
+    print(f"{'users':>6}{'replies':>9}{'seconds':>9}{'replies/s':>11}{'speedup':>9}{'p50 s':>8}{'p95 s':>8}{'sessions':>10}")
+    for users in args.users:
+        elapsed, latencies, n_sessions = asyncio.run(run_load(bot, users, args.turns))
+        throughput = len(latencies) / elapsed
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"{users:>6}{len(latencies):>9}{elapsed:>9.2f}{throughput:>11.1f}{throughput / serialized:>9.1f}"
+              f"{statistics.median(latencies):>8.2f}{p95:>8.2f}{n_sessions:>10}")
+
+
+if __name__ == "__main__":
+    main()
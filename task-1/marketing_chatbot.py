@@ -0,0 +1,341 @@
+# task-1/marketing_chatbot.py
+import asyncio
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from langchain.prompts import PromptTemplate
+from langchain.chains import LLMChain
+from langchain_google_genai import ChatGoogleGenerativeAI
+from google import generativeai as genai
+from google.generativeai import caching
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.memory import TokenBudgetMemory
+
+# Sample marketing data for context
+marketing_data = {
+    "last_quarter_engagement": {
+        "email_open_rate": "24%",
+        "click_through_rate": "3.8%",
+        "conversion_rate": "1.2%",
+        "social_media_engagement": "12% increase",
+        "top_performing_channel": "Email marketing",
+        "key_insight": "Personalized subject lines increased open rates by 15%"
+    },
+    "holiday_season_campaign": {
+        "email_open_rate": "32%",
+        "click_through_rate": "5.2%",
+        "conversion_rate": "2.8%",
+        "social_media_engagement": "28% increase",
+        "top_performing_channel": "Social media ads",
+        "key_insight": "Limited-time offers drove 45% of total conversions"
+    },
+    "q1_campaigns": {
+        "campaign_budget": "$50,000",
+        "roi": "3.2x",
+        "customer_acquisition_cost": "$45",
+        "lifetime_value": "$210"
+    }
+}
+
+
+# Format marketing data as a readable string
+def format_marketing_data(data):
+    result = []
+    for period, metrics in data.items():
+        result.append(f"{period.replace('_', ' ').title()}:")
+        for key, value in metrics.items():
+            result.append(f"  - {key.replace('_', ' ').title()}: {value}")
+        result.append("")
+    return "\n".join(result)
+
+
+SYSTEM_PROMPT = """You are a helpful marketing analytics assistant. You help marketers analyze campaign performance,
+customer engagement trends, and provide data-driven insights. Use the marketing data and conversation history to maintain context."""
+
+# Set GEMINI_CONTEXT_CACHE=1 to keep the static prefix in a Gemini context cache instead of
+# sending it every turn (the prefix must meet Gemini's minimum cacheable size)
+USE_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"
+CONTEXT_CACHE_TTL = datetime.timedelta(seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600")))
+# The cache's TTL is extended once less than this share of it is left
+CONTEXT_CACHE_REFRESH_SHARE = 0.1
+
+# Conversations kept per process, and how long an idle one is kept
+MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+SESSION_IDLE_SECONDS = float(os.getenv("CHAT_SESSION_IDLE_SECONDS", "1800"))
+
+
+class MarketingChatBot:
+    """
+    Marketing analytics assistant over `marketing_data`.
+
+    The LLM, prompt and chain are shared; conversation memory is passed per call, so one
+    bot serves any number of sessions (see `SessionStore`). Calls without a memory use the
+    bot's own, as the single-user notebook does.
+
+    With the context cache on, its TTL is extended shortly before it lapses (or the cache
+    is recreated), and a call that fails against the cached context is retried once with
+    the prefix inline.
+    """
+
+    MODEL = "gemini-2.5-flash"
+
+    def __init__(self, marketing_data=marketing_data, use_context_cache=USE_CONTEXT_CACHE, llm=None):
+        self.use_context_cache = use_context_cache
+        self.cached_content = None
+        self._cache_expires = 0.0
+        self._cache_lock = threading.Lock()
+
+        # Initialize the ChatGoogleGenerativeAI model (or use the one given, e.g. a fake in load tests)
+        self.custom_llm = llm is not None
+        self.base_llm = llm if llm is not None else self._make_llm()
+        self.llm = self.base_llm
+
+        # Conversation history capped at MEMORY_MAX_TOKENS: the last turns verbatim, older
+        # turns relevant to the new message, and a running summary written in the background
+        self.memory = self.new_memory()
+
+        # Store marketing data; renders the context block and builds the chain
+        self.marketing_data = marketing_data
+
+    def _make_llm(self, cached_content=None):
+        # cached_content is only passed when used (it needs langchain-google-genai 2.x)
+        extra = {"cached_content": cached_content} if cached_content else {}
+        return ChatGoogleGenerativeAI(
+            model=self.MODEL,
+            google_api_key=os.getenv("GEMINI_API_KEY"),
+            temperature=0.7,
+            **extra
+        )
+
+    def new_memory(self):
+        return TokenBudgetMemory(llm=self.base_llm, input_key="input", output_key="output")
+
+    @property
+    def marketing_data(self):
+        return self._marketing_data
+
+    @marketing_data.setter
+    def marketing_data(self, data):
+        """Replace the marketing data. The context block is rendered here, once, not per message."""
+        self._marketing_data = data
+        self.marketing_context = format_marketing_data(data)
+        # Static part first, identical on every turn, so it is a cacheable prompt prefix
+        self.prefix = f"{SYSTEM_PROMPT}\n\nMarketing Data:\n{self.marketing_context}"
+        self._build_chain()
+
+    def _create_context_cache(self):
+        """Gemini cached content holding the prefix, or None when caching is off or fails."""
+        if self.cached_content is not None:
+            try:
+                self.cached_content.delete()
+            except Exception:
+                pass
+            self.cached_content = None
+        if not self.use_context_cache or self.custom_llm:
+            return None
+        try:
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            self.cached_content = caching.CachedContent.create(
+                model=f"models/{self.MODEL}",
+                display_name="marketing-data",
+                system_instruction=self.prefix,
+                ttl=CONTEXT_CACHE_TTL
+            )
+            self._cache_expires = time.time() + CONTEXT_CACHE_TTL.total_seconds()
+            return self.cached_content.name
+        except Exception as e:
+            # Too small to cache, or unsupported: send the prefix inline instead
+            logging.warning("Context caching unavailable, sending marketing data inline: %s", e)
+            return None
+
+    def _cache_needs_refresh(self):
+        if self.cached_content is None:
+            return False
+        margin = CONTEXT_CACHE_TTL.total_seconds() * CONTEXT_CACHE_REFRESH_SHARE
+        return time.time() >= self._cache_expires - margin
+
+    def _refresh_context_cache(self):
+        """Extend the context cache's TTL before it lapses; recreate it (or go inline) if that fails."""
+        with self._cache_lock:
+            if not self._cache_needs_refresh():
+                return
+            try:
+                self.cached_content.update(ttl=CONTEXT_CACHE_TTL)
+                self._cache_expires = time.time() + CONTEXT_CACHE_TTL.total_seconds()
+                return
+            except Exception as e:
+                logging.warning("Extending the Gemini context cache failed, recreating it: %s", e)
+            self._build_chain()
+
+    def _use_inline(self, error):
+        """Log a failed cached-context call and have the cache refreshed before the next one."""
+        logging.warning("Call with the Gemini context cache failed, retrying with the prefix inline: %s", error)
+        self._cache_expires = 0.0
+
+    @staticmethod
+    def _make_chain(llm, prompt):
+        # Create a chain with the LLM and Prompt (using LLMChain instead of ConversationChain)
+        return LLMChain(
+            llm=llm,
+            prompt=prompt,
+            # CHAT_VERBOSE=1 logs every full prompt
+            verbose=os.getenv("CHAT_VERBOSE", "0") == "1"
+        )
+
+    def _build_chain(self):
+        template = """{prefix}
+
+Conversation History:
+{history}
+
+Marketer: {input}
+Assistant:"""
+        # Bound as a partial, so braces in the data are never parsed as template fields
+        inline_prompt = PromptTemplate(input_variables=["history", "input", "prefix"], template=template).partial(prefix=self.prefix)
+        # Always built: the fallback when the cached context cannot be used
+        self.inline_chain = self._make_chain(self.base_llm, inline_prompt)
+        self.inline_stream_chain = inline_prompt | self.base_llm
+
+        cached_content = self._create_context_cache()
+        if cached_content:
+            self.llm = self._make_llm(cached_content)
+            template = """Conversation History:
+{history}
+
+Marketer: {input}
+Assistant:"""
+            self.prompt = PromptTemplate(input_variables=["history", "input"], template=template)
+            self.chain = self._make_chain(self.llm, self.prompt)
+            # Same prompt and model as a runnable, for token streaming
+            self.stream_chain = self.prompt | self.llm
+        else:
+            self.llm, self.prompt = self.base_llm, inline_prompt
+            self.chain, self.stream_chain = self.inline_chain, self.inline_stream_chain
+
+    def _inputs(self, user_input, memory):
+        # Get the conversation history from memory
+        memory_variables = memory.load_memory_variables({"input": user_input})
+        history = memory_variables.get("history", "")
+        # The marketing data is already in the prompt prefix
+        return {"history": history, "input": user_input}
+
+    def get_response(self, user_input, memory=None):
+        """Get response from the chatbot"""
+        memory = memory or self.memory
+        try:
+            if self._cache_needs_refresh():
+                self._refresh_context_cache()
+            inputs = self._inputs(user_input, memory)
+            chain = self.chain
+            try:
+                response = chain.invoke(inputs)
+            except Exception as e:
+                if chain is self.inline_chain:
+                    raise
+                self._use_inline(e)
+                response = self.inline_chain.invoke(inputs)
+            # Save the conversation to memory
+            memory.save_context({"input": user_input}, {"output": response["text"]})
+            return response["text"]
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    async def aget_response(self, user_input, memory=None):
+        """Async `get_response`: waits on the LLM without holding a worker thread."""
+        memory = memory or self.memory
+        try:
+            if self._cache_needs_refresh():
+                # Network calls to the caching API; kept off the event loop
+                await asyncio.to_thread(self._refresh_context_cache)
+            inputs = self._inputs(user_input, memory)
+            chain = self.chain
+            try:
+                response = await chain.ainvoke(inputs)
+            except Exception as e:
+                if chain is self.inline_chain:
+                    raise
+                self._use_inline(e)
+                response = await self.inline_chain.ainvoke(inputs)
+            memory.save_context({"input": user_input}, {"output": response["text"]})
+            return response["text"]
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+
+    async def astream_response(self, user_input, memory=None):
+        """Yield the reply piece by piece as Gemini generates it; memory is saved once it completes."""
+        memory = memory or self.memory
+        parts = []
+        try:
+            if self._cache_needs_refresh():
+                await asyncio.to_thread(self._refresh_context_cache)
+            inputs = self._inputs(user_input, memory)
+            stream_chain = self.stream_chain
+            try:
+                async for chunk in stream_chain.astream(inputs):
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield chunk.content
+            except Exception as e:
+                # Retried inline only if nothing was sent yet
+                if stream_chain is self.inline_stream_chain or parts:
+                    raise
+                self._use_inline(e)
+                async for chunk in self.inline_stream_chain.astream(inputs):
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield chunk.content
+        except Exception as e:
+            yield f"Error: {str(e)}"
+            return
+        memory.save_context({"input": user_input}, {"output": "".join(parts)})
+
+
+class SessionStore:
+    """
+    Conversation memories by session ID, created on first use.
+
+    Holds at most `max_sessions` (least recently used dropped first) and drops any
+    session idle for more than `idle_seconds`; eviction runs on access, so no timer
+    thread is needed.
+    """
+
+    def __init__(self, factory: Callable[[], object], max_sessions: int = MAX_SESSIONS, idle_seconds: float = SESSION_IDLE_SECONDS):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        # session_id -> (memory, last_used); oldest access first
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict(self, now: float) -> None:
+        while self._sessions:
+            session_id, (_, last_used) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - last_used <= self.idle_seconds:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
+
+    def get(self, session_id: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            memory = entry[0] if entry is not None and now - entry[1] <= self.idle_seconds else self.factory()
+            self._sessions[session_id] = (memory, now)
+            self._evict(now)
+            return memory
+
+    def drop(self, session_id: Optional[str]) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
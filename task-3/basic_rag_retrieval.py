@@ -1,15 +1,18 @@
 import os
-import numpy as np
-import faiss
+import sys
 import streamlit as st
 import asyncio
-from PyPDF2 import PdfReader
-from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 
 from google import generativeai as genai
 from langchain.chains import RetrievalQA
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.answer_cache import SemanticAnswerCache, context_hash
+from common.index_factory import IndexConfig
+from common.knowledge_base import KnowledgeBase
+from common.vector_index import streamlit_progress
+
 
 # Load environment variables from .env file
 load_dotenv()
@@ -17,7 +20,14 @@ load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 # Embedding model
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Chunking parameters (fixed when the knowledge base is first created)
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+# FAISS index layout, similarity metric and vector storage, configured through FAISS_* env vars
+INDEX_CONFIG = IndexConfig.from_env()
 
 # Asyncroi
 try:
@@ -25,85 +35,127 @@ try:
 except RuntimeError:
     asyncio.set_event_loop(asyncio.new_event_loop())
 
-def load_pdf(file):
-    text = ""
-    pdf = PdfReader(file)
-    for page in pdf.pages:
-        text += page.extract_text() or ""
-    return text
-
-# Function to chunk text into smaller pieces
-def chunk_text(text, chunk_size=500, overlap=50):
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i+chunk_size])
-        if chunk:
-            chunks.append(chunk)
-    return chunks
-
-# Function to create embeddings and build FAISS index
-def create_faiss_index(chunks):
-    if not chunks:
-        raise ValueError("No text chunks to index. Please check your PDF or chunking logic.")
-    embeddings = embedding_model.encode(chunks)
-    if len(embeddings.shape) == 1:
-        raise ValueError("Embedding model returned 1D embeddings. Check input chunks.")
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(np.array(embeddings).astype('float32'))
-    return index, chunks
-
-# Function to retrieve relevant chunks using FAISS of the query
-def retrieve_chunks(query, index, chunks, k=5):
-    query_embedding = embedding_model.encode([query])
-    distances, indices = index.search(np.array(query_embedding).astype('float32'), k)
-    return [chunks[i] for i in indices[0]]
+# Gemini model, created once per process instead of per question
+llm_model = genai.GenerativeModel('gemini-2.5-flash')
 
-# Function to generate answer using Google Gemini
-def generate_answer(query, context):
+# Function to retrieve relevant chunks (with source file and page) from the knowledge base
+def retrieve_chunks(query, kb, k=5, query_embedding=None):
+    return kb.search(query, k, query_embedding=query_embedding)
 
-    full_prompt = f"""
+# Prompt for answering from the retrieved context
+def build_prompt(query, context):
+    return f"""
 Answer the question using only the information provided in the context. Be accurate and detailed.
 if the answer is not in the context, say "The answer is not available in the provided context".
 Context: {context}
 Question: {query}
 Answer:
 """
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    response = model.generate_content(full_prompt)
+
+# Function to generate answer using Google Gemini
+def generate_answer(query, context):
+    response = llm_model.generate_content(build_prompt(query, context))
     return response.text
 
+# Function to stream the answer from Google Gemini as it is generated
+def generate_answer_stream(query, context):
+    for chunk in llm_model.generate_content(build_prompt(query, context), stream=True):
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. only safety or finish metadata)
+            continue
+        if text:
+            yield text
+
+# Function to answer a question from the knowledge base, serving repeated (or near-identical)
+# questions over unchanged context from the semantic answer cache instead of calling Gemini.
+# Returns an iterator of answer text pieces (None when nothing relevant was found).
+def answer_question(query, kb, cache):
+    query_embedding = kb.embed_query(query)
+    relevant_chunks = retrieve_chunks(query, kb, query_embedding=query_embedding)
+    context = "\n\n".join(f"[{c['source']}, page {c['page']}]\n{c['text']}" for c in relevant_chunks)
+    if not context:
+        return None
+    scope = ",".join(sorted({c["document_id"] for c in relevant_chunks}))
+    digest = context_hash(context)
+    answer = cache.lookup(scope, query_embedding, digest)
+    if answer is not None:
+        return iter([answer])
+
+    def stream():
+        parts = []
+        for text in generate_answer_stream(query, context):
+            parts.append(text)
+            yield text
+        # Cached only once the whole answer has arrived
+        cache.store(scope, query_embedding, digest, "".join(parts))
+    return stream()
+
+# Answer cache shared by every session of this process
+@st.cache_resource
+def get_answer_cache():
+    return SemanticAnswerCache()
+
+# One knowledge base per process, shared by every session
+@st.cache_resource
+def get_knowledge_base():
+    return KnowledgeBase(
+        "task-3",
+        model_name=EMBEDDING_MODEL_NAME,
+        chunk_size=CHUNK_SIZE,
+        overlap=CHUNK_OVERLAP,
+        config=INDEX_CONFIG,
+    )
+
 # Streamlit UI
 def main():
     st.set_page_config(page_title="Document QA with Google Gemini", layout="wide")
     st.title("Document QA on Brand & Campaign Documents")
 
-    if 'index' not in st.session_state:
-        st.session_state.index = None
-        st.session_state.chunks = None
+    kb = get_knowledge_base()
 
     with st.sidebar:
-        st.header("Upload Document")
-        uploaded_file = st.file_uploader("Upload a PDF file", type="pdf")
-        if uploaded_file:
-            text = load_pdf(uploaded_file)
-            chunks = chunk_text(text)
-            index, chunks = create_faiss_index(chunks)
-            st.session_state.index = index
-            st.session_state.chunks = chunks
-            st.success("Document processed and indexed!")
-
-    user_question = st.text_input("Enter your question about the document:")
-    if user_question and st.session_state.index and st.session_state.chunks is not None:
+        st.header("Upload Documents")
+        uploaded_files = st.file_uploader("Upload PDF files", type="pdf", accept_multiple_files=True)
+        # Each upload is ingested once per session, so a removed document is not re-added on rerun
+        seen_uploads = st.session_state.setdefault("seen_uploads", set())
+        for uploaded_file in uploaded_files or []:
+            if uploaded_file.file_id in seen_uploads:
+                continue
+            seen_uploads.add(uploaded_file.file_id)
+            # Files already in the shared knowledge base (same bytes) are not re-embedded
+            if not kb.has_document(kb.document_id(uploaded_file.getvalue())):
+                kb.add_pdf(uploaded_file.name, uploaded_file.getvalue(), progress_callback=streamlit_progress(uploaded_file.name))
+            st.success(f"{uploaded_file.name} processed and indexed!")
+
+        st.header("Knowledge Base")
+        documents = kb.list_documents()
+        if not documents:
+            st.write("No documents yet.")
+        for doc in documents:
+            col1, col2 = st.columns([4, 1])
+            col1.write(f"{doc['name']} ({doc['page_count']} pages)")
+            if col2.button("Remove", key=f"remove_{doc['id']}"):
+                kb.remove_document(doc["id"])
+                st.rerun()
+
+        stats = get_answer_cache().stats()
+        st.caption(
+            f"Answer cache: {stats['hit_rate']:.0%} hit rate "
+            f"({stats['hits']} hits / {stats['misses']} misses, {stats['entries']} entries, "
+            f"{stats['avg_lookup_ms']:.2f} ms per lookup)"
+        )
+
+    user_question = st.text_input("Enter your question about the documents:")
+    if user_question and kb.list_documents():
         with st.spinner("Retrieving answer..."):
-            relevant_chunks = retrieve_chunks(user_question, st.session_state.index, st.session_state.chunks)
-            context = "\n\n".join(relevant_chunks)
-            if context:
-                answer = generate_answer(user_question, context)
-                st.write(answer)
-            else:
-                st.write("No relevant context found in the document.")
+            answer = answer_question(user_question, kb, get_answer_cache())
+        if answer is not None:
+            # Rendered token by token as Gemini generates it
+            st.write_stream(answer)
+        else:
+            st.write("No relevant context found in the document.")
     elif user_question:
         st.warning("Please upload a document first.")
 
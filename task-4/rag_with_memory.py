@@ -1,116 +1,80 @@
 import os
-import numpy as np
-import faiss
+import sys
 import streamlit as st
 import asyncio
-from PyPDF2 import PdfReader
-from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 
 from google import generativeai as genai
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationalRetrievalChain
 from langchain_google_genai import GoogleGenerativeAI
-from langchain_community.vectorstores import FAISS as LangChainFAISS
-from langchain.retrievers.multi_query import MultiQueryRetriever
-from langchain.docstore.document import Document
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from streamlit_chat import message
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.conversational_rag import ConversationalRAG
+from common.index_factory import IndexConfig
+from common.knowledge_base import KnowledgeBase
+from common.memory import TokenBudgetMemory
+from common.vector_index import streamlit_progress
+
 # Load environment variables from .env file
 load_dotenv()
 # Initialize Google Generative AI with API key
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+# FAISS index layout, similarity metric and vector storage, configured through FAISS_* env vars
+INDEX_CONFIG = IndexConfig.from_env()
 # Asyncio
 try:
     asyncio.get_running_loop()
 except RuntimeError:
     asyncio.set_event_loop(asyncio.new_event_loop())
 
-def load_pdf(file):
-    text = ""
-    pdf = PdfReader(file)
-    for page in pdf.pages:
-        text += page.extract_text() or ""
-    return text
-
-# Function to chunk text into smaller pieces
-def chunk_text(text, chunk_size=500, overlap=50):
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i+chunk_size])
-        if chunk:
-            chunks.append(chunk)
-    return chunks
-
-# Function to create embeddings and build FAISS index
-def create_faiss_index(chunks):
-    if not chunks:
-        raise ValueError("No text chunks to index. Please check your PDF or chunking logic.")
-    embeddings = embedding_model.encode(chunks)
-    if len(embeddings.shape) == 1:
-        raise ValueError("Embedding model returned 1D embeddings. Check input chunks.")
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(np.array(embeddings).astype('float32'))
-    return index, chunks
-
-# Function to create LangChain-compatible FAISS vector store
-def create_langchain_vectorstore(chunks):
-    if not chunks:
-        raise ValueError("No text chunks to index.")
-    documents = [Document(page_content=chunk) for chunk in chunks]
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    vectorstore = LangChainFAISS.from_documents(documents, embeddings)
-    return vectorstore
+# One knowledge base per process, shared by every session. Each session only keeps
+# its own conversation chain (memory) on top of it.
+@st.cache_resource
+def get_knowledge_base():
+    return KnowledgeBase("task-4", model_name="all-MiniLM-L6-v2", chunk_size=100, overlap=20, config=INDEX_CONFIG)
+
+# Function to add uploaded PDFs to the shared knowledge base, once per upload per session
+def ingest_uploads(kb, uploaded_files):
+    seen_uploads = st.session_state.setdefault("seen_uploads", set())
+    added = []
+    for uploaded_file in uploaded_files:
+        if uploaded_file.file_id in seen_uploads:
+            continue
+        seen_uploads.add(uploaded_file.file_id)
+        # Files already in the knowledge base (same bytes) are not re-embedded
+        if not kb.has_document(kb.document_id(uploaded_file.getvalue())):
+            kb.add_pdf(uploaded_file.name, uploaded_file.getvalue(), progress_callback=streamlit_progress(uploaded_file.name))
+        added.append(uploaded_file.name)
+    return added
 
 # Function to create conversational chain with memory
-def create_conversational_chain(vectorstore):
+def create_conversational_chain(kb):
     llm = GoogleGenerativeAI(
         model="gemini-2.5-flash",
         google_api_key=os.getenv("GEMINI_API_KEY"),
         temperature=0.3
     )
-    retriever = MultiQueryRetriever.from_llm(
-        retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
-        llm=llm
-    )
-    memory = ConversationBufferMemory(
+    # History capped at MEMORY_MAX_TOKENS: recent turns, relevant older turns and a running summary
+    memory = TokenBudgetMemory(
+        llm=llm,
         memory_key="chat_history",
-        return_messages=True,
+        input_key="question",
         output_key="answer"
     )
-    qa_chain = ConversationalRetrievalChain.from_llm(
-        llm=llm,
-        retriever=retriever,
-        memory=memory,
-        return_source_documents=True,
-        verbose=True
-    )
+    # Condenses the question and generates query variants concurrently, then searches
+    # all of them in one batch (replaces ConversationalRetrievalChain + MultiQueryRetriever)
+    qa_chain = ConversationalRAG(kb=kb, llm=llm, memory=memory, k=3)
     return qa_chain
 
-# Function to retrieve relevant chunks using FAISS of the query
-def retrieve_chunks(query, index, chunks, k=5):
-    query_embedding = embedding_model.encode([query])
-    distances, indices = index.search(np.array(query_embedding).astype('float32'), k)
-    return [chunks[i] for i in indices[0]]
+# Function to retrieve relevant chunks (with source file and page) from the knowledge base
+def retrieve_chunks(query, kb, k=5):
+    return kb.search(query, k)
 
 
-import streamlit as st
-
-# --- Your existing imports ---
-# from your_module import load_pdf, chunk_text, create_faiss_index, create_langchain_vectorstore, create_conversational_chain, retrieve_chunks
-
 # --- Initialize session state ---
 if "qa_chain" not in st.session_state:
     st.session_state.qa_chain = None
-if "index" not in st.session_state:
-    st.session_state.index = None
-if "chunk_list" not in st.session_state:
-    st.session_state.chunk_list = None
 if "history" not in st.session_state:
     st.session_state.history = []
 
@@ -119,22 +83,18 @@ st.title("📊 Campaign Data QA Bot")
 st.write("Upload a marketing campaign PDF and ask questions interactively!")
 
 # --- PDF Upload ---
-uploaded_file = st.file_uploader("📁 Upload your campaign PDF", type=["pdf"])
+kb = get_knowledge_base()
+uploaded_files = st.file_uploader("📁 Upload your campaign PDFs", type=["pdf"], accept_multiple_files=True)
 
-if uploaded_file is not None and st.session_state.qa_chain is None:
+if uploaded_files:
     with st.spinner("Processing PDF..."):
-        campaign_text = load_pdf(uploaded_file)
-        chunks = chunk_text(campaign_text, chunk_size=100, overlap=20)
-        index, chunk_list = create_faiss_index(chunks)
-        vectorstore = create_langchain_vectorstore(chunks)
-        qa_chain = create_conversational_chain(vectorstore)
-
-        # Save to session
-        st.session_state.qa_chain = qa_chain
-        st.session_state.index = index
-        st.session_state.chunk_list = chunk_list
+        added = ingest_uploads(kb, uploaded_files)
+    if added:
+        st.success("✅ PDF successfully processed! You can now chat with the bot.")
 
-    st.success("✅ PDF successfully processed! You can now chat with the bot.")
+# Save to session: only the conversation chain is per user, the index is shared
+if st.session_state.qa_chain is None and kb.list_documents():
+    st.session_state.qa_chain = create_conversational_chain(kb)
 
 
 # --- Chat Section ---
@@ -149,8 +109,8 @@ def chat_with_bot():
     if not query.strip():
         st.session_state.history.append([query, "⚠️ Enter a valid message."])
         return
-    response = qa_chain({"question": query})
-    st.session_state.history.append([query, response["answer"]])
+    # Answered below the history, where it can be streamed into place
+    st.session_state.pending_query = query
     st.session_state.query = ""  # Clear input after sending
 
 
@@ -161,17 +121,23 @@ if st.session_state.history:
         st.markdown(f"**Bot:** {bot_msg}")
         st.markdown("---")
 
+# --- Stream the answer to the new message ---
+if st.session_state.get("pending_query"):
+    query = st.session_state.pop("pending_query")
+    st.markdown(f"**You:** {query}")
+    st.markdown("**Bot:**")
+    result, tokens = st.session_state.qa_chain.stream({"question": query})
+    st.write_stream(tokens)
+    st.session_state.history.append([query, result["answer"]])
+    st.markdown("---")
+
 # Text input with on_change triggers chat
 st.text_input("Ask a question about the marketing data:", key="query", on_change=chat_with_bot)
 
 st.title("Document QA on Brand & Campaign Documents")
 
 # Initialize session state
-if 'index' not in st.session_state:
-    st.session_state.index = None
-    st.session_state.chunks = None
-    st.session_state.vectorstore = None
-    st.session_state.qa_chain = None
+if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 
 if 'generated' not in st.session_state:
@@ -182,59 +148,85 @@ if 'past' not in st.session_state:
 
 # Sidebar for document upload
 with st.sidebar:
-    st.header("Upload Document")
-    uploaded_file = st.file_uploader("Upload a PDF file", type="pdf")
-    if uploaded_file:
-        text = load_pdf(uploaded_file)
-        chunks = chunk_text(text)
-        index, chunks = create_faiss_index(chunks)
-        vectorstore = create_langchain_vectorstore(chunks)
-        qa_chain = create_conversational_chain(vectorstore)
-        st.session_state.index = index
-        st.session_state.chunks = chunks
-        st.session_state.vectorstore = vectorstore
-        st.session_state.qa_chain = qa_chain
+    st.header("Upload Documents")
+    sidebar_files = st.file_uploader("Upload PDF files", type="pdf", accept_multiple_files=True)
+    if sidebar_files and ingest_uploads(kb, sidebar_files):
+        st.session_state.qa_chain = create_conversational_chain(kb)
         st.session_state.chat_history = []
         st.success("Document processed and indexed with memory enabled!")
+
+    st.header("Knowledge Base")
+    for doc in kb.list_documents():
+        col1, col2 = st.columns([4, 1])
+        col1.write(f"{doc['name']} ({doc['page_count']} pages)")
+        if col2.button("Remove", key=f"remove_{doc['id']}"):
+            kb.remove_document(doc["id"])
+            st.rerun()
+
     if st.session_state.qa_chain is not None:
         if st.button("Clear Conversation History"):
             st.session_state.chat_history = []
             st.session_state.generated = []
             st.session_state.past = []
-            st.session_state.qa_chain = create_conversational_chain(st.session_state.vectorstore)
+            st.session_state.turns = []
+            st.session_state.qa_chain = create_conversational_chain(kb)
             st.success("Conversation history cleared!")
 
+if 'turns' not in st.session_state:
+    st.session_state.turns = []
+
+# One record per answered question: everything the UI shows for a turn comes from here,
+# so rendering sources never runs the pipeline again
+def turn_result(question, result):
+    return {
+        "question": question,
+        "answer": result["answer"],
+        "sources": [
+            {
+                "source": doc.metadata.get("source"),
+                "page": doc.metadata.get("page"),
+                "score": doc.metadata.get("score"),
+                "text": doc.page_content,
+            }
+            for doc in result.get("source_documents", [])
+        ],
+    }
+
 def process_question():
     if st.session_state.input and st.session_state.qa_chain is not None:
-        with st.spinner("Retrieving answer with context memory..."):
-            try:
-                result = st.session_state.qa_chain({"question": st.session_state.input})
-                answer = result["answer"]
-                st.session_state.chat_history.append({
-                    "question": st.session_state.input,
-                    "answer": answer
-                })
-                st.session_state.past.append(st.session_state.input)
-                st.session_state.generated.append(answer)
-                st.session_state.input = ""
-            except Exception as e:
-                st.error(f"Error generating answer: {str(e)}")
+        # Answered below the conversation, where it can be streamed into place
+        st.session_state.pending_question = st.session_state.input
+        st.session_state.input = ""
     elif st.session_state.input:
         st.warning("Please upload a document first.")
 
-# Display current answer if available
-if st.session_state.generated:
-    # Optionally show source documents from the last result
-    if st.session_state.qa_chain is not None and st.session_state.input:
-        try:
-            result = st.session_state.qa_chain({"question": st.session_state.input})
-            if "source_documents" in result:
-                with st.expander("View Source Documents"):
-                    for i, doc in enumerate(result["source_documents"][:3]):
-                        st.write(f"**Source {i+1}:**")
-                        st.write(doc.page_content[:300] + "...")
-        except:
-            pass
+def answer_pending_question():
+    question = st.session_state.pop("pending_question")
+    message(question, is_user=True, key=str(len(st.session_state.past)) + '_user')
+    try:
+        with st.spinner("Retrieving answer with context memory..."):
+            result, tokens = st.session_state.qa_chain.stream({"question": question})
+        st.write_stream(tokens)
+    except Exception as e:
+        st.error(f"Error generating answer: {str(e)}")
+        return False
+    turn = turn_result(question, result)
+    answer = turn["answer"]
+    st.session_state.turns.append(turn)
+    st.session_state.chat_history.append({
+        "question": question,
+        "answer": answer
+    })
+    st.session_state.past.append(question)
+    st.session_state.generated.append(answer)
+    return True
+
+# Show the source documents of the last answer, from the stored turn
+if st.session_state.turns and st.session_state.turns[-1]["sources"]:
+    with st.expander("View Source Documents"):
+        for i, source in enumerate(st.session_state.turns[-1]["sources"][:3]):
+            st.write(f"**Source {i+1}:** {source['source']}, page {source['page']} (score {source['score']:.3f})")
+            st.write(source["text"][:300] + "...")
 
 # Display conversation history in chat format
 if st.session_state['generated']:
@@ -243,4 +235,8 @@ if st.session_state['generated']:
         message(st.session_state.generated[i], key=str(i),
                 avatar_style="adventurer", seed=123)
 
+# Stream the answer to a new question, then redraw it as part of the conversation (with its sources)
+if st.session_state.get("pending_question") and answer_pending_question():
+    st.rerun()
+
 user_input = st.text_input("Enter Your Question about document: ", key="input", on_change=process_question)
\ No newline at end of file
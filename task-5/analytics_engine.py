@@ -0,0 +1,291 @@
+# analytics_engine.py
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import sqlparse
+from sqlparse import sql as S
+from sqlparse import tokens as T
+
+from query_planner import _sources, _strip_strings
+from schema_cache import _quote, file_stamp
+from sql_executor import SQL_MAX_ROWS, SQL_TIMEOUT_SECONDS, QueryResult, QueryTimeout
+
+logger = logging.getLogger(__name__)
+
+# "duckdb" routes aggregate / sorting SELECTs to an in-memory DuckDB copy of the tables
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "sqlite").lower()
+# Queries on smaller tables stay on SQLite, which wins below this size (benchmarks/analytics_benchmark.py)
+ANALYTICS_MIN_ROWS = int(os.getenv("ANALYTICS_MIN_ROWS", "50000"))
+# Rows copied from SQLite per batch while loading the snapshot
+LOAD_BATCH = 100_000
+
+# Worth a columnar engine: aggregation, grouping, sorting
+_ANALYTIC_RE = re.compile(r"\b(?:GROUP\s+BY|ORDER\s+BY|DISTINCT|COUNT|SUM|AVG|MIN|MAX)\b", re.IGNORECASE)
+# SQLite semantics DuckDB does not share (case-insensitive LIKE, date modifiers, rowid, ...): stay on SQLite
+_SQLITE_ONLY_RE = re.compile(
+    r"\b(?:LIKE|GLOB|ROWID|OID|_ROWID_)\b|\b(?:date|time|datetime|julianday|strftime|unixepoch|printf|total|"
+    r"group_concat|ifnull|instr|substr|typeof|randomblob|zeroblob|likelihood|iif)\s*\(",
+    re.IGNORECASE,
+)
+_DUCKDB_TYPES = {"INT": "BIGINT", "REAL": "DOUBLE", "FLOA": "DOUBLE", "DOUB": "DOUBLE", "TEXT": "VARCHAR"}
+_NUMPY_TYPES = {"BIGINT": (np.int64, 0), "DOUBLE": (np.float64, 0.0), "VARCHAR": (str, "")}
+
+
+def sqlite_column_names(sql_text: str) -> Optional[List[str]]:
+    """
+    Result column names SQLite would give the outermost SELECT: the alias, the bare
+    column name, or else the expression text as written (DuckDB would say `count_star()`
+    where SQLite says `COUNT(*)`). None when the list contains `*`.
+    """
+    statement = sqlparse.parse(sql_text)[0]
+    tokens = [t for t in statement.tokens if not t.is_whitespace and t.ttype not in T.Comment]
+    for i, token in enumerate(tokens):
+        if token.ttype is T.Keyword.DML and token.normalized == "SELECT":
+            break
+    else:
+        return None
+    items = tokens[i + 1:]
+    while items and items[0].ttype is T.Keyword and items[0].normalized in ("DISTINCT", "ALL"):
+        items = items[1:]
+    if not items:
+        return None
+    columns = list(items[0].get_identifiers()) if isinstance(items[0], S.IdentifierList) else [items[0]]
+    names = []
+    for column in columns:
+        text = str(column).strip()
+        if "*" in text and (text.endswith("*") or text.endswith(".*")):
+            return None
+        alias = column.get_alias() if isinstance(column, (S.Identifier, S.Function)) else None
+        if alias:
+            names.append(alias)
+        elif isinstance(column, S.Identifier) and re.fullmatch(r"(?:\w+\.)?\w+", text):
+            names.append(column.get_real_name())
+        else:
+            names.append(text)
+    return names
+
+
+def _column_array(values: Tuple, duck_type: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Typed NumPy array of one column (DuckDB scans these fast, unlike object arrays) and its NULL mask."""
+    dtype, filler = _NUMPY_TYPES[duck_type]
+    nulls = None
+    if any(v is None for v in values):
+        nulls = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+        values = [filler if v is None else v for v in values]
+    return np.array(values, dtype=dtype), nulls
+
+
+def _duckdb_type(declared: str) -> str:
+    declared = (declared or "").upper()
+    for affinity, duck_type in _DUCKDB_TYPES.items():
+        if affinity in declared:
+            return duck_type
+    return "VARCHAR"
+
+
+class DuckDBAnalytics:
+    """
+    In-memory DuckDB copy of the SQLite tables, for GROUP BY / ORDER BY heavy SELECTs.
+
+    The snapshot is loaded in the background and refreshed, also in the background,
+    once a query sees the database file changed: tables that only gained rows (new rowids, unchanged count below them) get
+    just the new rows appended, anything else (schema change, deletes) is reloaded in
+    full. In-place UPDATEs keep the row count and max rowid, so they are only seen after
+    `refresh(full=True)`. `routes()` picks the queries to send here; the caller falls
+    back to SQLite on any DuckDB error. Integer division and NULL ordering are set to
+    SQLite's, and file access is disabled so SQL cannot read outside the snapshot.
+    """
+
+    def __init__(self, db_path: str, connect: Optional[Callable[[], sqlite3.Connection]] = None,
+                 timeout: float = SQL_TIMEOUT_SECONDS, min_rows: int = ANALYTICS_MIN_ROWS, background: bool = True):
+        import duckdb
+
+        self.db_path = db_path
+        self.connect = connect or (lambda: sqlite3.connect(db_path))
+        self.timeout = timeout
+        self.min_rows = min_rows
+        self._duckdb = duckdb
+        self.con = duckdb.connect(config={"enable_external_access": False})
+        self.con.execute("SET GLOBAL integer_division = true")
+        self.con.execute("SET GLOBAL default_null_order = 'nulls_first_on_asc_last_on_desc'")
+        self._refresh_lock = threading.Lock()
+        self._stamp = None
+        self._schema_version = None
+        # table -> (row count, max rowid) as loaded
+        self._loaded: Dict[str, Tuple[int, int]] = {}
+        self.ready = False
+        self.queries = 0
+        self.fallbacks = 0
+        self.refreshes = {"full": 0, "incremental": 0}
+        if background:
+            self.refresh_in_background()
+
+    # ----------------------------
+    # Snapshot
+    # ----------------------------
+    def _refresh_quietly(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Loading the DuckDB snapshot failed; queries stay on SQLite")
+
+    def refresh_in_background(self) -> None:
+        if not self._refresh_lock.locked():
+            threading.Thread(target=self._refresh_quietly, name="duckdb-load", daemon=True).start()
+
+    @staticmethod
+    def _copy_rows(duck, conn: sqlite3.Connection, table: str, target: str, columns: List[Tuple[str, str]],
+                   after_rowid: int) -> int:
+        """Copy the rows of `table` past `after_rowid` into DuckDB `target`, one typed NumPy batch at a time."""
+        names = [name for name, _ in columns]
+        cur = conn.execute(f"SELECT {', '.join(_quote(c) for c in names)} FROM {_quote(table)} "
+                           "WHERE rowid > ? ORDER BY rowid", (after_rowid,))
+        copied = 0
+        try:
+            while True:
+                rows = cur.fetchmany(LOAD_BATCH)
+                if not rows:
+                    break
+                batch, select = {}, []
+                for i, ((name, duck_type), values) in enumerate(zip(columns, zip(*rows))):
+                    array, nulls = _column_array(values, duck_type)
+                    batch[f"c{i}"] = array
+                    if nulls is None:
+                        select.append(f"c{i}")
+                    else:
+                        batch[f"n{i}"] = nulls
+                        select.append(f"CASE WHEN n{i} THEN NULL ELSE c{i} END")
+                duck.register("sqlite_batch", batch)
+                duck.execute(f"INSERT INTO {_quote(target)} SELECT {', '.join(select)} FROM sqlite_batch")
+                duck.unregister("sqlite_batch")
+                copied += len(rows)
+        finally:
+            cur.close()
+        return copied
+
+    def _load_table(self, duck, conn: sqlite3.Connection, table: str, count: int, max_rowid: int, full: bool) -> None:
+        columns = [(c[1], _duckdb_type(c[2])) for c in conn.execute(f"PRAGMA table_info({_quote(table)})")]
+        previous = self._loaded.get(table)
+        if not full and previous is not None:
+            if previous == (count, max_rowid):
+                return
+            appended = conn.execute(f"SELECT COUNT(*) FROM {_quote(table)} WHERE rowid > ?", (previous[1],)).fetchone()[0]
+            if previous[0] + appended == count:
+                duck.execute("BEGIN TRANSACTION")
+                try:
+                    self._copy_rows(duck, conn, table, table, columns, previous[1])
+                    duck.execute("COMMIT")
+                except Exception:
+                    duck.execute("ROLLBACK")
+                    raise
+                self._loaded[table] = (count, max_rowid)
+                self.refreshes["incremental"] += 1
+                return
+        # Build beside the live table, then swap, so queries never see a half-loaded table
+        staging = f"{table}__loading"
+        duck.execute(f"DROP TABLE IF EXISTS {_quote(staging)}")
+        duck.execute(f"CREATE TABLE {_quote(staging)} ("
+                     + ", ".join(f"{_quote(name)} {duck_type}" for name, duck_type in columns) + ")")
+        self._copy_rows(duck, conn, table, staging, columns, -(2 ** 63))
+        duck.execute("BEGIN TRANSACTION")
+        duck.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+        duck.execute(f"ALTER TABLE {_quote(staging)} RENAME TO {_quote(table)}")
+        duck.execute("COMMIT")
+        self._loaded[table] = (count, max_rowid)
+        self.refreshes["full"] += 1
+
+    def refresh(self, full: bool = False) -> None:
+        """Bring the snapshot up to date with the SQLite file (cheap when nothing changed)."""
+        stamp = file_stamp(self.db_path)
+        if stamp == self._stamp and not full:
+            return
+        with self._refresh_lock:
+            if stamp == self._stamp and not full:
+                return
+            started = time.perf_counter()
+            conn = self.connect()
+            # One DuckDB connection for the whole load, so its transactions cover the inserts
+            duck = self.con.cursor()
+            try:
+                schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+                full = full or schema_version != self._schema_version
+                tables = [r[0] for r in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+                for table in tables:
+                    count, max_rowid = conn.execute(f"SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM {_quote(table)}").fetchone()
+                    self._load_table(duck, conn, table, count, max_rowid, full)
+                for table in set(self._loaded) - set(tables):
+                    duck.execute(f"DROP TABLE IF EXISTS {_quote(table)}")
+                    del self._loaded[table]
+            finally:
+                duck.close()
+                conn.close()
+            self._schema_version = schema_version
+            self._stamp = stamp
+            self.ready = True
+            logger.info("DuckDB snapshot refreshed in %.2fs: %s", time.perf_counter() - started,
+                        {t: n for t, (n, _) in self._loaded.items()})
+
+    # ----------------------------
+    # Queries
+    # ----------------------------
+    def routes(self, sql_text: str, data_version=None) -> bool:
+        """
+        Whether `sql_text` should run here: analytic, SQLite-neutral, only on snapshot
+        tables, and reading one of at least `min_rows` rows. A snapshot older than
+        `data_version` (a `file_stamp`) is refreshed in the background and not used meanwhile.
+        """
+        if not self.ready:
+            return False
+        if data_version is not None and data_version != self._stamp:
+            self.refresh_in_background()
+            return False
+        text = _strip_strings(sql_text)
+        if not _ANALYTIC_RE.search(text) or _SQLITE_ONLY_RE.search(text):
+            return False
+        sources = set(_sources(text).values())
+        ctes = {m.lower() for m in re.findall(r"(?:\bWITH(?:\s+RECURSIVE)?|,)\s*(\w+)\s+AS\s*\(", text, re.IGNORECASE)}
+        if not all(table in self._loaded or table in ctes for table in sources):
+            return False
+        return max((self._loaded[t][0] for t in sources if t in self._loaded), default=0) >= self.min_rows
+
+    def execute_sync(self, sql_text: str, offset: int = 0, max_rows: int = SQL_MAX_ROWS,
+                     timeout: Optional[float] = None) -> QueryResult:
+        """Rows of `sql_text` from `offset`, capped at `max_rows`, with SQLite's column names."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.perf_counter()
+        cur = self.con.cursor()
+        timer = threading.Timer(timeout, cur.interrupt) if timeout else None
+        try:
+            if timer:
+                timer.start()
+            cur.execute(f"SELECT * FROM ({sql_text}) OFFSET {int(offset)}" if offset else sql_text)
+            columns = [d[0] for d in cur.description]
+            names = sqlite_column_names(sql_text)
+            if names and len(names) == len(columns):
+                columns = names
+            batch = cur.fetchmany(max_rows + 1)
+        except self._duckdb.InterruptException as e:
+            raise QueryTimeout(f"Query timed out after {timeout:g}s") from e
+        finally:
+            if timer:
+                timer.cancel()
+            cur.close()
+        self.queries += 1
+        rows = [dict(zip(columns, row)) for row in batch[:max_rows]]
+        return QueryResult(columns, rows, len(batch) > max_rows, time.perf_counter() - started)
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "tables": {table: count for table, (count, _) in self._loaded.items()},
+            "queries": self.queries,
+            "fallbacks": self.fallbacks,
+            "refreshes": dict(self.refreshes),
+        }
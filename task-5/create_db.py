@@ -1,12 +1,54 @@
 # create_db.py
+"""
+Create portfolio.db with synthetic campaigns, customers and leads.
+
+`--scale` multiplies the base dataset (20 campaigns, 60 customers, 100 leads), so
+`--scale 100000` writes 10M leads. Rows are generated in parallel chunks by worker
+processes and inserted by the main process with executemany, one transaction per chunk,
+with SQLite's fast-load pragmas; indexes are built once the data is in.
+
+    python create_db.py --scale 100000 --workers 8
+"""
+import argparse
+import multiprocessing
+import os
 import sqlite3
+import time
 from faker import Faker
 import random
-from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
 
-fake = Faker()
 DB_PATH = "portfolio.db"
 
+# Rows per table at scale 1
+BASE_ROWS = {"campaigns": 20, "customers": 60, "leads": 100}
+# Rows generated (and committed) per chunk
+CHUNK_ROWS = 100_000
+# Chunks generated ahead of the writer, per worker; caps memory when generation outpaces inserts
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+# Distinct fake names drawn per worker; Faker is far too slow to call once per row
+NAME_POOL = 5000
+
+INSERTS = {
+    "campaigns": "INSERT INTO campaigns (id,client,name,start_date,end_date,spend,channel,conversions,roi) VALUES (?,?,?,?,?,?,?,?,?)",
+    "customers": "INSERT INTO customers (id,name,age,region,loyalty_score,churn_risk) VALUES (?,?,?,?,?,?)",
+    "leads": "INSERT INTO leads (id,campaign_id,status,conversion_probability) VALUES (?,?,?,?)",
+}
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_leads_campaign_id ON leads(campaign_id);
+CREATE INDEX IF NOT EXISTS idx_leads_status ON leads(status);
+CREATE INDEX IF NOT EXISTS idx_campaigns_channel ON campaigns(channel);
+CREATE INDEX IF NOT EXISTS idx_campaigns_start_date ON campaigns(start_date);
+CREATE INDEX IF NOT EXISTS idx_customers_region ON customers(region);
+"""
+
+channels = ['email', 'social', 'search', 'display', 'affiliate']
+regions = ['North', 'South', 'East', 'West', 'Urban', 'Rural']
+statuses = ['open', 'contacted', 'converted', 'lost']
+
 def create_schema(conn):
     cur = conn.cursor()
     cur.executescript("""
@@ -45,55 +87,136 @@ def create_schema(conn):
     """)
     conn.commit()
 
-def seed_data(conn):
-    cur = conn.cursor()
-    channels = ['email', 'social', 'search', 'display', 'affiliate']
-    regions = ['North', 'South', 'East', 'West', 'Urban', 'Rural']
-
-    campaign_ids = []
-    for i in range(1, 21):
-        client = fake.company()
-        name = f"{client.split()[0]} Campaign {i}"
-        start = fake.date_between(start_date='-1y', end_date='today')
-        end = start + timedelta(days=random.randint(10, 90))
-        spend = round(random.uniform(5000, 200000), 2)
-        channel = random.choice(channels)
-        conversions = random.randint(10, 5000)
-        roi = round(random.uniform(0.5, 8.0), 2)
-        cur.execute(
-            "INSERT INTO campaigns (client,name,start_date,end_date,spend,channel,conversions,roi) VALUES (?,?,?,?,?,?,?,?)",
-            (client, name, start.isoformat(), end.isoformat(), spend, channel, conversions, roi)
-        )
-        campaign_ids.append(cur.lastrowid)
-
-    for i in range(1, 61):
-        name = fake.name()
-        age = random.randint(18, 70)
-        region = random.choice(regions)
-        loyalty_score = round(random.uniform(0, 100), 2)
-        churn_risk = random.randint(0, 100)
-        cur.execute(
-            "INSERT INTO customers (name,age,region,loyalty_score,churn_risk) VALUES (?,?,?,?,?)",
-            (name, age, region, loyalty_score, churn_risk)
-        )
+def create_indexes(conn):
+    conn.executescript(INDEXES)
+    # Planner statistics for the new indexes
+    conn.execute("ANALYZE")
+    conn.commit()
+
+# ----------------------------
+# Row generation (runs in worker processes)
+# ----------------------------
+_names = None
 
-    statuses = ['open', 'contacted', 'converted', 'lost']
-    for i in range(1, 101):
-        campaign_id = random.choice(campaign_ids)
-        status = random.choice(statuses)
-        conversion_probability = round(random.uniform(0, 1), 3)
-        cur.execute(
-            "INSERT INTO leads (campaign_id,status,conversion_probability) VALUES (?,?,?)",
-            (campaign_id, status, conversion_probability)
+def _name_pools(seed, size):
+    """Company and person names drawn once per process, then sampled per row."""
+    global _names
+    if _names is None:
+        faker = Faker()
+        faker.seed_instance(seed)
+        _names = (
+            [faker.company() for _ in range(size)],
+            [faker.name() for _ in range(size)],
         )
-    conn.commit()
+    return _names
+
+def generate_chunk(task):
+    """Rows `start_id .. start_id + count - 1` of one table, reproducible from the seed."""
+    table, start_id, count, seed, n_campaigns = task
+    rng = random.Random(f"{seed}-{table}-{start_id}")
+    companies, people = _name_pools(seed, min(NAME_POOL, n_campaigns * 3))
+    today = date.today()
+    rows = []
+    if table == "campaigns":
+        for i in range(start_id, start_id + count):
+            client = rng.choice(companies)
+            name = f"{client.split()[0]} Campaign {i}"
+            start = today - timedelta(days=rng.randint(0, 365))
+            end = start + timedelta(days=rng.randint(10, 90))
+            rows.append((i, client, name, start.isoformat(), end.isoformat(), round(rng.uniform(5000, 200000), 2),
+                         rng.choice(channels), rng.randint(10, 5000), round(rng.uniform(0.5, 8.0), 2)))
+    elif table == "customers":
+        for i in range(start_id, start_id + count):
+            rows.append((i, rng.choice(people), rng.randint(18, 70), rng.choice(regions),
+                         round(rng.uniform(0, 100), 2), rng.randint(0, 100)))
+    else:
+        for i in range(start_id, start_id + count):
+            rows.append((i, rng.randint(1, n_campaigns), rng.choice(statuses), round(rng.uniform(0, 1), 3)))
+    return table, rows
+
+def chunk_tasks(scale, seed):
+    counts = {table: max(1, int(base * scale)) for table, base in BASE_ROWS.items()}
+    tasks = []
+    for table, total in counts.items():
+        for start in range(1, total + 1, CHUNK_ROWS):
+            tasks.append((table, start, min(CHUNK_ROWS, total - start + 1), seed, counts["campaigns"]))
+    return counts, tasks
+
+# ----------------------------
+# Loading
+# ----------------------------
+def set_fast_load_pragmas(conn):
+    # Safe only because a failed load is simply re-run from scratch
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-262144")  # 256 MB
+
+def seed_data(conn, scale=1, workers=1, seed=0):
+    counts, tasks = chunk_tasks(scale, seed)
+    total = sum(counts.values())
+    done = 0
+    started = time.perf_counter()
+
+    def insert(table, rows):
+        nonlocal done
+        # One transaction per chunk: executemany inside BEGIN/COMMIT, not a commit per row
+        with conn:
+            conn.executemany(INSERTS[table], rows)
+        done += len(rows)
+        if total >= CHUNK_ROWS:
+            rate = done / max(time.perf_counter() - started, 1e-9)
+            print(f"\r{done:,}/{total:,} rows ({rate:,.0f} rows/s)", end="", flush=True)
+
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            insert(*generate_chunk(task))
+    else:
+        # Workers generate chunks in parallel; SQLite has one writer, so the main process inserts
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            pending = iter(tasks)
+            # Submitted in order and consumed from the left, so chunks are inserted in task order
+            in_flight = deque(pool.submit(generate_chunk, task)
+                              for _, task in zip(range(workers * CHUNKS_IN_FLIGHT_PER_WORKER), pending))
+            while in_flight:
+                table, rows = in_flight.popleft().result()
+                task = next(pending, None)
+                if task is not None:
+                    in_flight.append(pool.submit(generate_chunk, task))
+                insert(table, rows)
+    if total >= CHUNK_ROWS:
+        print()
+    return counts
 
 def main():
-    conn = sqlite3.connect(DB_PATH)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1, help="multiplier on 20 campaigns / 60 customers / 100 leads")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=None, help="fixed seed for a reproducible dataset")
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    for path in (args.db, args.db + "-wal", args.db + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    conn = sqlite3.connect(args.db)
+    set_fast_load_pragmas(conn)
     create_schema(conn)
-    seed_data(conn)
+    started = time.perf_counter()
+    counts = seed_data(conn, args.scale, args.workers, seed)
+    loaded = time.perf_counter()
+    create_indexes(conn)
+    conn.close()
+
+    # Back to normal durability, in WAL mode so API readers never wait on a writer
+    conn = sqlite3.connect(args.db)
+    conn.execute("PRAGMA journal_mode=WAL")
     conn.close()
-    print(f"Created {DB_PATH} with sample data")
+    print(f"Created {args.db} with sample data: "
+          + ", ".join(f"{n:,} {table}" for table, n in counts.items())
+          + f" (load {loaded - started:.1f}s, indexes {time.perf_counter() - loaded:.1f}s)")
 
 if __name__ == "__main__":
     main()
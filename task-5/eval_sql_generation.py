@@ -0,0 +1,172 @@
+# eval_sql_generation.py
+"""
+Offline evaluation of SQL generation with repairs, with a scripted model standing in for Gemini.
+
+Every question in sample_queries.txt has a scripted list of SQL answers: the first is
+returned for the generation prompt, the next ones for each repair prompt, and several
+start with the kind of mistake Gemini makes (misspelled column, wrong table name,
+syntax error). Each question runs through the same `SQLGenerator` loop, query planner
+and read-only executor as the API, against a fresh synthetic database. The report
+compares success@1 (first SQL ran) with success@N (ran within N attempts) and gives
+p50/p95 latency per question.
+
+    python eval_sql_generation.py --attempts 1 2 3 --latency 0.2 --scale 100
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from create_db import create_indexes, create_schema, seed_data
+from query_cache import normalize_question
+from query_planner import PlanRejected, QueryPlanner
+from schema_cache import describe_schema
+from sql_executor import ReadOnlyExecutor
+from sql_generation import SQLGenerator
+from sql_guard import validate_sql
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_queries.txt")
+
+# Normalized question -> SQL for the generation prompt, then for each repair prompt
+SCRIPTED_SQL = {
+    "list top 5 campaigns by roi in the last 6 months": [
+        "SELECT name, roi FROM campaigns WHERE start_date >= date('now', '-6 months') ORDER BY roi DESC LIMIT 5",
+    ],
+    "which channels drive the most conversions for campaigns with spend > 50000": [
+        "SELECT channel, SUM(conversion) AS total FROM campaigns WHERE spend > 50000 GROUP BY channel ORDER BY total DESC",
+        "SELECT channel, SUM(conversions) AS total FROM campaigns WHERE spend > 50000 GROUP BY channel ORDER BY total DESC",
+    ],
+    "show customers in urban region with loyalty_score > 80 sorted by churn_risk desc": [
+        "SELECT name, loyalty_score, churn_risk FROM customer WHERE region = 'Urban' AND loyalty_score > 80 ORDER BY churn_risk DESC",
+        "SELECT name, loyalty_score, churn_risk FROM customers WHERE region = 'Urban' AND loyalty_score > 80 ORDER BY churn_risk DESC LIMIT 100",
+    ],
+    "how many leads were converted per campaign": [
+        "SELECT c.name, COUNT(*) AS converted FROM leads l JOIN campaigns c ON c.id = l.campaign_id "
+        "WHERE l.status = 'converted' GROUP BY c.id ORDER BY converted DESC LIMIT 100",
+    ],
+    "top 10 campaigns targeting 'social' channel by conversions per rupee spent": [
+        "SELECT name, conversions / spend AS per_rupee FROM campaigns WHERE channel = 'social' ORDER BY per_rupee DESC LIMT 10",
+        "SELECT name, conversions / spend AS per_rupee FROM campaigns WHERE channel = social ORDER BY per_rupee DESC LIMIT 10",
+        "SELECT name, conversions * 1.0 / spend AS per_rupee FROM campaigns WHERE channel = 'social' ORDER BY per_rupee DESC LIMIT 10",
+    ],
+}
+
+
+class ScriptedSQLModel(BaseChatModel):
+    """Chat model replaying SCRIPTED_SQL after a fixed delay, without any network call."""
+
+    latency: float = 0.2
+    repairs: Dict[str, int] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-sql"
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        text = messages[-1].content
+        m = re.search(r"User question:\s*(.*?)\s*$", text, flags=re.DOTALL)
+        question = normalize_question(m.group(1)) if m else ""
+        script = SCRIPTED_SQL.get(question)
+        if "Previous SQL:" in text:
+            self.repairs[question] = self.repairs.get(question, 0) + 1
+        else:
+            self.repairs[question] = 0
+        if not script:
+            content = "NO_SQL"
+        else:
+            content = f"```sql\n{script[min(self.repairs[question], len(script) - 1)]}\n```"
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+
+def build_database(path: str, scale: float) -> None:
+    conn = sqlite3.connect(path)
+    create_schema(conn)
+    seed_data(conn, scale, workers=1, seed=0)
+    create_indexes(conn)
+    conn.close()
+
+
+async def evaluate(questions: List[str], executor: ReadOnlyExecutor, planner: QueryPlanner, schema_text: str,
+                   attempts: int, latency: float):
+    generator = SQLGenerator(ScriptedSQLModel(latency=latency), max_attempts=attempts)
+
+    def review(sql_text):
+        with executor.connection() as conn:
+            return planner.review(conn, sql_text)
+
+    async def execute(sql_text):
+        sql_text = validate_sql(sql_text)
+        plan = await executor.run(review, sql_text)
+        if plan.rejected:
+            raise PlanRejected(plan)
+        return await executor.execute(plan.sql)
+
+    latencies = []
+    for question in questions:
+        started = time.perf_counter()
+        outcome = await generator.run(question, schema_text, execute)
+        latencies.append(time.perf_counter() - started)
+        status = "ok" if outcome.ok else f"failed: {outcome.error}"
+        print(f"  [{len(outcome.attempts)} attempt(s)] {question[:60]:<60} {status}")
+    return generator.attempt_stats.stats(), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attempts", type=int, nargs="+", default=[1, 2, 3], help="max attempts (N) to compare")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per fake LLM call")
+    parser.add_argument("--scale", type=float, default=10, help="create_db.py scale of the test database")
+    parser.add_argument("--questions", default=QUESTIONS_FILE)
+    args = parser.parse_args()
+    # Index advice is not what is being measured here
+    logging.getLogger("query_planner").setLevel(logging.ERROR)
+
+    with open(args.questions, encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "eval.db")
+        build_database(db_path, args.scale)
+        executor = ReadOnlyExecutor(db_path)
+        conn = executor.connect()
+        schema_text = describe_schema(conn)
+        conn.close()
+
+        rows = []
+        for attempts in args.attempts:
+            print(f"max attempts {attempts}:")
+            stats, latencies = asyncio.run(evaluate(questions, executor, QueryPlanner(), schema_text,
+                                                    attempts, args.latency))
+            p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+            rows.append((attempts, stats["success_at_1"], stats["success_at_n"], statistics.median(latencies), p95))
+        executor.close()
+
+    print(f"\n{len(questions)} questions, fake LLM latency {args.latency:.2f}s")
+    print(f"{'N':>3}{'success@1':>11}{'success@N':>11}{'p50 s':>8}{'p95 s':>8}")
+    for attempts, first, within, p50, p95 in rows:
+        print(f"{attempts:>3}{first:>11.0%}{within:>11.0%}{p50:>8.2f}{p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
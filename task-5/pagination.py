@@ -0,0 +1,50 @@
+# pagination.py
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+from typing import Tuple
+
+from sql_executor import SQL_MAX_ROWS
+
+# Rows in the first page of a /query response and in each /query/page
+SQL_PAGE_SIZE = int(os.getenv("SQL_PAGE_SIZE", "500"))
+# Signs cursors so clients cannot swap in their own SQL; random per process unless set
+CURSOR_SECRET = os.getenv("CURSOR_SECRET", "").encode() or secrets.token_bytes(32)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def clamp_page_size(page_size) -> int:
+    return max(1, min(int(page_size or SQL_PAGE_SIZE), SQL_MAX_ROWS))
+
+
+def _sign(payload: bytes) -> str:
+    return hmac.new(CURSOR_SECRET, payload, hashlib.sha256).hexdigest()
+
+
+def encode_cursor(sql_text: str, offset: int) -> str:
+    """Opaque, signed token for the rows of `sql_text` from `offset` on."""
+    payload = json.dumps({"sql": sql_text, "offset": offset}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode() + "." + _sign(payload)
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        encoded, signature = cursor.rsplit(".", 1)
+        payload = base64.urlsafe_b64decode(encoded.encode())
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise InvalidCursor("Cursor signature does not match (expired by a server restart?)")
+    data = json.loads(payload)
+    return data["sql"], int(data["offset"])
+
+
+def page_sql(sql_text: str) -> str:
+    """`sql_text` from a bound OFFSET on; rows past the page are never fetched, so the scan stops there."""
+    return f"SELECT * FROM ({sql_text}) LIMIT -1 OFFSET ?"
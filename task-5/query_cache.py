@@ -0,0 +1,112 @@
+# query_cache.py
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+# Generated SQL kept per (question, schema version)
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "1000"))
+# Result sets kept per (SQL, data version)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+# Larger result sets are not cached
+RESULT_CACHE_MAX_ROWS = int(os.getenv("RESULT_CACHE_MAX_ROWS", "10000"))
+
+
+def normalize_question(question: str) -> str:
+    """Cache key for a question: case, spacing, Unicode forms and trailing punctuation do not matter."""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?.!")
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that drops the least recently used entry and counts hits/misses."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class QueryCache:
+    """
+    Two-level cache in front of the NL-to-SQL pipeline.
+
+    Level 1 maps (normalized question, schema version) to the generated SQL, so a
+    repeated question skips the LLM. Level 2 maps (SQL, data version) to its rows, so it
+    also skips the database until the data changes; the data version is any value that
+    changes on every write (e.g. the database file stamp), and a new one drops every
+    cached result at once.
+    """
+
+    def __init__(self, sql_entries: int = SQL_CACHE_SIZE, result_entries: int = RESULT_CACHE_SIZE,
+                 max_rows: int = RESULT_CACHE_MAX_ROWS):
+        self.sql = LRUCache(sql_entries)
+        self.results = LRUCache(result_entries)
+        self.max_rows = max_rows
+        self._data_version: Optional[Hashable] = None
+        self._version_lock = threading.Lock()
+
+    # Level 1
+    def get_sql(self, question: str, schema_version: int) -> Optional[str]:
+        return self.sql.get((normalize_question(question), schema_version))
+
+    def put_sql(self, question: str, schema_version: int, sql: str) -> None:
+        self.sql.put((normalize_question(question), schema_version), sql)
+
+    # Level 2
+    def _check_data_version(self, data_version: Hashable) -> None:
+        with self._version_lock:
+            if data_version != self._data_version:
+                self.results.clear()
+                self._data_version = data_version
+
+    def get_rows(self, sql: str, data_version: Hashable) -> Optional[List[Dict[str, Any]]]:
+        self._check_data_version(data_version)
+        return self.results.get((sql, data_version))
+
+    def put_rows(self, sql: str, data_version: Hashable, rows: List[Dict[str, Any]]) -> None:
+        if len(rows) <= self.max_rows:
+            self._check_data_version(data_version)
+            self.results.put((sql, data_version), rows)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {"sql": self.sql.stats(), "results": self.results.stats()}
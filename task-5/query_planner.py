@@ -0,0 +1,290 @@
+# query_planner.py
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from schema_cache import _quote
+
+logger = logging.getLogger(__name__)
+
+# Queries estimated to examine more rows than this are rewritten (LIMIT) or rejected
+SQL_SCAN_ROW_LIMIT = int(os.getenv("SQL_SCAN_ROW_LIMIT", "5000000"))
+# LIMIT injected into over-budget queries that can stop early
+SQL_INJECTED_LIMIT = int(os.getenv("SQL_INJECTED_LIMIT", os.getenv("SQL_MAX_ROWS", "10000")))
+# Rows assumed for subquery results and tables without statistics
+DEFAULT_ROWS = 1000
+
+_SOURCE_RE = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?", re.IGNORECASE)
+_NOT_ALIAS = {"where", "join", "on", "left", "right", "inner", "outer", "cross", "natural", "group", "order",
+              "limit", "having", "union", "except", "intersect", "using", "window", "full"}
+_OP = r"(?:=|<>|!=|<=|>=|<|>|\bIN\b|\bBETWEEN\b|\bLIKE\b|\bIS\b)"
+_COLUMN = r"(?:([A-Za-z_]\w*)\.)?([A-Za-z_]\w*)"
+_LEFT_PREDICATE_RE = re.compile(_COLUMN + r"\s*" + _OP, re.IGNORECASE)
+_RIGHT_PREDICATE_RE = re.compile(r"(?:=|<>|!=|<=|>=|<|>)\s*" + _COLUMN, re.IGNORECASE)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_TOP_LIMIT_RE = re.compile(r"\bLIMIT\s+\d+(?:\s*(?:,|OFFSET)\s*\d+)?\s*;?\s*$", re.IGNORECASE)
+# Constructs that need every row before the first one comes out, so a LIMIT does not stop the scan early
+_BLOCKING_RE = re.compile(r"\b(?:GROUP\s+BY|ORDER\s+BY|DISTINCT|COUNT|SUM|AVG|MIN|MAX|TOTAL|GROUP_CONCAT)\b", re.IGNORECASE)
+
+
+@dataclass
+class PlanStep:
+    id: int
+    parent: int
+    detail: str
+
+
+@dataclass
+class PlanReview:
+    sql: str                          # SQL to run (possibly rewritten)
+    estimated_rows: int               # rows SQLite is expected to examine
+    plan: List[str]
+    full_scans: List[str]             # tables read in full
+    recommended_indexes: List[str]
+    rewritten: bool = False
+    rejected: bool = False
+    reason: Optional[str] = None
+
+
+class PlanRejected(Exception):
+    """A query whose plan is over the row budget; `review` holds the estimate and index advice."""
+
+    def __init__(self, review: PlanReview):
+        super().__init__(f"Query rejected: {review.reason}")
+        self.review = review
+
+
+@dataclass
+class _TableMeta:
+    columns: Set[str]
+    indexed: Set[str]                 # leading columns of existing indexes (and the rowid)
+    index_stats: Dict[str, List[int]] = field(default_factory=dict)
+
+
+def _strip_strings(sql: str) -> str:
+    return _STRING_RE.sub("?", sql)
+
+
+def _sources(sql: str) -> Dict[str, str]:
+    """Alias (or table name) -> table name for every FROM/JOIN source."""
+    sources = {}
+    for table, alias in _SOURCE_RE.findall(sql):
+        sources[table.lower()] = table.lower()
+        if alias and alias.lower() not in _NOT_ALIAS:
+            sources[alias.lower()] = table.lower()
+    return sources
+
+
+def _predicate_columns(sql: str) -> List[Tuple[Optional[str], str]]:
+    """(qualifier, column) pairs compared in WHERE/ON/HAVING clauses."""
+    text = _strip_strings(sql)
+    pairs = _LEFT_PREDICATE_RE.findall(text) + _RIGHT_PREDICATE_RE.findall(text)
+    return [(q.lower() or None, c.lower()) for q, c in pairs]
+
+
+class QueryPlanner:
+    """
+    Reviews SQL with `EXPLAIN QUERY PLAN` before it runs.
+
+    The plan is turned into an estimate of rows examined (full scans from table sizes,
+    index searches from `sqlite_stat1`, nested loops multiplied out). Queries over
+    `scan_row_limit` that stream their rows get a `LIMIT` (or keep their own); those that
+    must read everything first (aggregates, sorts, DISTINCT) are rejected.
+    Every full scan filtered or joined on an unindexed column produces an index
+    recommendation; `report()` aggregates them over all reviewed queries.
+    """
+
+    def __init__(self, scan_row_limit: int = SQL_SCAN_ROW_LIMIT, injected_limit: int = SQL_INJECTED_LIMIT):
+        self.scan_row_limit = scan_row_limit
+        self.injected_limit = injected_limit
+        self._lock = threading.Lock()
+        self._meta: Dict[str, _TableMeta] = {}
+        self._meta_version: Optional[int] = None
+        # CREATE INDEX statement -> aggregated workload that would have used it
+        self._recommendations: Dict[str, Dict] = {}
+        self.reviewed = 0
+        self.rewritten = 0
+        self.rejected = 0
+
+    # ----------------------------
+    # Database metadata
+    # ----------------------------
+    def _table_meta(self, conn: sqlite3.Connection) -> Dict[str, _TableMeta]:
+        version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        with self._lock:
+            if version == self._meta_version:
+                return self._meta
+        meta = {}
+        tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+        has_stats = conn.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone() is not None
+        stats = {}
+        if has_stats:
+            stats = {idx: [int(x) for x in stat.split() if x.isdigit()]
+                     for _, idx, stat in conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1 WHERE idx IS NOT NULL")}
+        for table in tables:
+            quoted = _quote(table)
+            cols = conn.execute(f"PRAGMA table_info({quoted})").fetchall()
+            indexed = {"rowid"} | {c[1].lower() for c in cols if c[5]}
+            index_stats = {}
+            for index in conn.execute(f"PRAGMA index_list({quoted})").fetchall():
+                info = conn.execute(f"PRAGMA index_info({_quote(index[1])})").fetchall()
+                if info and info[0][2]:
+                    indexed.add(info[0][2].lower())
+                if index[1] in stats:
+                    index_stats[index[1]] = stats[index[1]]
+            meta[table.lower()] = _TableMeta({c[1].lower() for c in cols}, indexed, index_stats)
+        with self._lock:
+            self._meta, self._meta_version = meta, version
+        return meta
+
+    @staticmethod
+    def _row_count(conn: sqlite3.Connection, table: str, meta: _TableMeta) -> int:
+        for stat in meta.index_stats.values():
+            if stat:
+                return stat[0]
+        # MAX(rowid) is a single b-tree descent, unlike COUNT(*)
+        try:
+            row = conn.execute(f"SELECT MAX(rowid) FROM {_quote(table)}").fetchone()
+        except sqlite3.Error:
+            return DEFAULT_ROWS
+        return int(row[0] or 0)
+
+    # ----------------------------
+    # Cost estimate
+    # ----------------------------
+    def _step_rows(self, detail: str, sources: Dict[str, str], meta: Dict[str, _TableMeta],
+                   counts: Dict[str, int]) -> Tuple[int, Optional[str]]:
+        """Rows examined per execution of one SCAN/SEARCH step, and the table if it is a full scan."""
+        if detail.startswith("SCAN CONSTANT ROW"):
+            return 1, None
+        words = detail.split()
+        table = sources.get(words[1].lower(), words[1].lower()) if len(words) > 1 else ""
+        rows = counts.get(table, DEFAULT_ROWS)
+        if words[0] == "SCAN":
+            return rows, table if table in meta else None
+        if "INTEGER PRIMARY KEY" in detail:
+            return 1, None
+        match = re.search(r"USING (?:COVERING )?INDEX (\S+) \((.*)\)", detail)
+        if not match:
+            return max(rows // 10, 1), None
+        index, terms = match.groups()
+        equalities = terms.count("=?")
+        stat = meta[table].index_stats.get(index) if table in meta else None
+        if stat and 0 < equalities < len(stat):
+            estimate = stat[equalities]
+        else:
+            estimate = rows // 10 if equalities else rows // 4
+        # Range terms (col>? / col<?) narrow further
+        if re.search(r"[<>]\?", terms):
+            estimate //= 4
+        return max(estimate, 1), None
+
+    def _cost(self, steps: Dict[int, List[PlanStep]], parent: int, outer: int, sources, meta, counts,
+              full_scans: List[str]) -> int:
+        total = 0
+        loop = outer
+        for step in steps.get(parent, []):
+            if step.detail.startswith(("SCAN ", "SEARCH ")):
+                per_probe, scanned = self._step_rows(step.detail, sources, meta, counts)
+                if scanned:
+                    full_scans.append(scanned)
+                # Sibling SCAN/SEARCH steps are nested loops, in plan order
+                loop *= per_probe
+                total += loop
+                total += self._cost(steps, step.id, loop, sources, meta, counts, full_scans)
+            elif step.detail.startswith("CORRELATED"):
+                # Re-run for every row of the enclosing loop
+                total += self._cost(steps, step.id, loop, sources, meta, counts, full_scans)
+            else:
+                total += self._cost(steps, step.id, 1, sources, meta, counts, full_scans)
+        return total
+
+    # ----------------------------
+    # Review
+    # ----------------------------
+    def explain(self, conn: sqlite3.Connection, sql_text: str) -> List[PlanStep]:
+        return [PlanStep(r[0], r[1], r[3]) for r in conn.execute("EXPLAIN QUERY PLAN " + sql_text)]
+
+    def _recommend(self, sql_text: str, full_scans: List[str], sources: Dict[str, str],
+                   meta: Dict[str, _TableMeta]) -> List[str]:
+        aliases = defaultdict(set)
+        for alias, table in sources.items():
+            aliases[table].add(alias)
+        predicates = _predicate_columns(sql_text)
+        recommendations = []
+        for table in dict.fromkeys(full_scans):
+            table_meta = meta[table]
+            for qualifier, column in predicates:
+                if qualifier is not None and qualifier not in aliases[table]:
+                    continue
+                if column in table_meta.columns and column not in table_meta.indexed:
+                    statement = f"CREATE INDEX idx_{table}_{column} ON {table}({column})"
+                    if statement not in recommendations:
+                        recommendations.append(statement)
+        return recommendations
+
+    def review(self, conn: sqlite3.Connection, sql_text: str) -> PlanReview:
+        """Plan, estimate and (if needed) rewrite or reject one SELECT."""
+        sql_text = sql_text.strip().rstrip(";").strip()
+        meta = self._table_meta(conn)
+        sources = _sources(_strip_strings(sql_text))
+        counts = {table: self._row_count(conn, table, table_meta) for table, table_meta in meta.items()}
+        plan = self.explain(conn, sql_text)
+        steps: Dict[int, List[PlanStep]] = defaultdict(list)
+        for step in plan:
+            steps[step.parent].append(step)
+        full_scans: List[str] = []
+        estimated = self._cost(steps, 0, 1, sources, meta, counts, full_scans)
+        recommendations = self._recommend(sql_text, full_scans, sources, meta)
+        result = PlanReview(sql_text, estimated, [s.detail for s in plan], list(dict.fromkeys(full_scans)), recommendations)
+
+        if estimated > self.scan_row_limit:
+            blocking = _BLOCKING_RE.search(_strip_strings(sql_text)) or any("TEMP B-TREE" in s.detail for s in plan)
+            if blocking:
+                result.rejected = True
+                result.reason = f"estimated {estimated:,} rows examined, over the {self.scan_row_limit:,} row limit"
+            elif not _TOP_LIMIT_RE.search(sql_text):
+                # Streams row by row, so a LIMIT stops the scan after the first rows
+                result.sql = f"SELECT * FROM ({sql_text}) LIMIT {self.injected_limit}"
+                result.rewritten = True
+                result.reason = f"estimated {estimated:,} rows examined; limited to {self.injected_limit:,} rows"
+
+        self._record(result)
+        return result
+
+    # ----------------------------
+    # Workload report
+    # ----------------------------
+    def _record(self, result: PlanReview) -> None:
+        with self._lock:
+            self.reviewed += 1
+            self.rewritten += result.rewritten
+            self.rejected += result.rejected
+            for statement in result.recommended_indexes:
+                entry = self._recommendations.setdefault(
+                    statement, {"index": statement, "queries": 0, "estimated_rows": 0, "example": result.sql}
+                )
+                entry["queries"] += 1
+                entry["estimated_rows"] += result.estimated_rows
+        if result.recommended_indexes or result.rejected or result.rewritten:
+            logger.warning(
+                "Query plan: %s rows estimated, full scans %s, %s; would help: %s",
+                f"{result.estimated_rows:,}", result.full_scans or "none",
+                result.reason or "accepted", "; ".join(result.recommended_indexes) or "no index",
+            )
+
+    def report(self) -> Dict:
+        """Recommended indexes over all reviewed queries, the most rows they would save first."""
+        with self._lock:
+            recommendations = sorted(self._recommendations.values(), key=lambda r: r["estimated_rows"], reverse=True)
+            return {
+                "reviewed": self.reviewed,
+                "rewritten": self.rewritten,
+                "rejected": self.rejected,
+                "recommended_indexes": [dict(r) for r in recommendations],
+            }
@@ -0,0 +1,122 @@
+# schema_cache.py
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+# Distinct example values shown per column
+SCHEMA_SAMPLE_VALUES = int(os.getenv("SCHEMA_SAMPLE_VALUES", "3"))
+# Longer sample values are cut to this many characters
+SAMPLE_VALUE_CHARS = 40
+# Rows read per column to find those values, so sampling stays cheap on large tables
+SAMPLE_SCAN_ROWS = 1000
+
+
+@dataclass(frozen=True)
+class SchemaInfo:
+    version: int          # PRAGMA schema_version when the description was built
+    text: str             # description for the SQL prompt
+
+
+def file_stamp(db_path: str) -> Tuple:
+    """(mtime, size) of the database and its WAL file: changes whenever anything is written."""
+    stamp = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            st = os.stat(path)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sample(value) -> str:
+    text = repr(value) if isinstance(value, str) else str(value)
+    return text if len(text) <= SAMPLE_VALUE_CHARS else text[:SAMPLE_VALUE_CHARS - 3] + "..."
+
+
+def describe_schema(conn: sqlite3.Connection, sample_values: int = SCHEMA_SAMPLE_VALUES) -> str:
+    """Tables with column types, primary/foreign keys, indexes and a few sample values per column."""
+    cur = conn.cursor()
+    tables = []
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;")
+    for (tname,) in cur.fetchall():
+        if tname.startswith("sqlite_"):
+            continue
+        qname = _quote(tname)
+        cols = cur.execute(f"PRAGMA table_info({qname})").fetchall()
+        col_strs = [f"{c[1]} {c[2]}{' PRIMARY KEY' if c[5] else ''}" for c in cols]
+        lines = [f"Table {tname}: ({', '.join(col_strs)})"]
+
+        fks = cur.execute(f"PRAGMA foreign_key_list({qname})").fetchall()
+        if fks:
+            lines.append("  Foreign keys: " + ", ".join(f"{fk[3]} -> {fk[2]}({fk[4]})" for fk in fks))
+
+        indexes = []
+        for index in cur.execute(f"PRAGMA index_list({qname})").fetchall():
+            index_cols = [c[2] for c in cur.execute(f"PRAGMA index_info({_quote(index[1])})").fetchall()]
+            if index_cols:
+                indexes.append(f"{index[1]}({', '.join(index_cols)})")
+        if indexes:
+            lines.append("  Indexes: " + ", ".join(indexes))
+
+        if sample_values > 0:
+            samples = []
+            for c in cols:
+                if c[5]:
+                    continue
+                # From the first SAMPLE_SCAN_ROWS non-null rows only: a bare DISTINCT ... LIMIT reads
+                # the whole table when a column has fewer distinct values than the LIMIT
+                column = _quote(c[1])
+                values = cur.execute(
+                    f"SELECT DISTINCT {column} FROM (SELECT {column} FROM {qname} WHERE {column} IS NOT NULL LIMIT ?) LIMIT ?",
+                    (SAMPLE_SCAN_ROWS, sample_values),
+                ).fetchall()
+                if values:
+                    samples.append(f"{c[1]}: {', '.join(_sample(v[0]) for v in values)}")
+            if samples:
+                lines.append("  Sample values: " + "; ".join(samples))
+        tables.append("\n".join(lines))
+    return "\n".join(tables)
+
+
+class SchemaCache:
+    """
+    Schema description of one SQLite database, built once and reused across requests.
+
+    Each `get()` only stats the database files; the schema is re-read when they changed
+    and `PRAGMA schema_version` moved, so data-only writes cost one pragma, not a full
+    introspection.
+    """
+
+    def __init__(self, db_path: str, connect: Optional[Callable[[], sqlite3.Connection]] = None,
+                 sample_values: int = SCHEMA_SAMPLE_VALUES):
+        self.db_path = db_path
+        self.connect = connect or (lambda: sqlite3.connect(db_path))
+        self.sample_values = sample_values
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._info: Optional[SchemaInfo] = None
+
+    def get(self) -> SchemaInfo:
+        stamp = file_stamp(self.db_path)
+        info = self._info
+        if info is not None and stamp == self._stamp:
+            return info
+        with self._lock:
+            if self._info is not None and stamp == self._stamp:
+                return self._info
+            conn = self.connect()
+            try:
+                version = conn.execute("PRAGMA schema_version").fetchone()[0]
+                if self._info is None or version != self._info.version:
+                    self._info = SchemaInfo(version, describe_schema(conn, self.sample_values))
+            finally:
+                conn.close()
+            self._stamp = stamp
+            return self._info
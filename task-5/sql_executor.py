@@ -0,0 +1,190 @@
+# sql_executor.py
+import asyncio
+import os
+import queue
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Queries run at once (one pooled connection per worker thread)
+SQL_WORKERS = int(os.getenv("SQL_WORKERS", "4"))
+# A query still running after this many seconds is interrupted
+SQL_TIMEOUT_SECONDS = float(os.getenv("SQL_TIMEOUT_SECONDS", "10"))
+# Rows returned per query at most; the rest are never fetched
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "10000"))
+# SQLite VM instructions between timeout checks
+PROGRESS_INTERVAL = 10000
+FETCH_BATCH = 500
+# Authorizer actions a read-only query needs; everything else (PRAGMA, ATTACH, writes, DDL) is denied
+ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+DENIED_FUNCTIONS = {"load_extension", "readfile", "writefile", "edit"}
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+@dataclass
+class QueryResult:
+    columns: List[str]
+    rows: List[Dict[str, Any]]
+    truncated: bool        # more rows existed beyond the row cap
+    seconds: float
+
+
+def read_only_authorizer(action: int, arg1, arg2, db_name, trigger) -> int:
+    """`set_authorizer` callback that lets only reads through when a statement is prepared."""
+    if action not in ALLOWED_ACTIONS:
+        return sqlite3.SQLITE_DENY
+    if action == sqlite3.SQLITE_FUNCTION and (arg2 or "").lower() in DENIED_FUNCTIONS:
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
+
+
+def ensure_wal(db_path: str) -> None:
+    """Switch the database to WAL (persistent, once per file) so readers never block on a writer."""
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        # Read-only file system or locked: readers still work, just without WAL
+        pass
+
+
+class ReadOnlyExecutor:
+    """
+    Runs SQL against one SQLite file on a pool of read-only connections.
+
+    Connections are opened with a `mode=ro` URI plus `PRAGMA query_only`, and `execute`
+    prepares statements under a read-only authorizer, so even SQL that slipped past
+    validation cannot write, attach databases or change pragmas. Queries run on a thread pool (`execute` is
+    awaitable, leaving the event loop free), each bounded by a timeout enforced through
+    SQLite's progress handler and by a row cap applied while fetching.
+    """
+
+    def __init__(self, db_path: str, workers: int = SQL_WORKERS, timeout: float = SQL_TIMEOUT_SECONDS,
+                 max_rows: int = SQL_MAX_ROWS):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.max_rows = max_rows
+        ensure_wal(db_path)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sqlite")
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        for _ in range(workers):
+            self._pool.put(self.connect())
+
+    def connect(self) -> sqlite3.Connection:
+        """New read-only connection (pooled ones are handed out by `connection()`)."""
+        uri = f"file:{os.path.abspath(self.db_path)}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _deadline(self, conn: sqlite3.Connection, timeout: Optional[float]):
+        if not timeout:
+            yield
+            return
+        deadline = time.monotonic() + timeout
+        # A non-zero return aborts the statement with "interrupted"
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_INTERVAL)
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if "interrupted" in str(e):
+                raise QueryTimeout(f"Query timed out after {timeout:g}s") from e
+            raise
+        finally:
+            conn.set_progress_handler(None, PROGRESS_INTERVAL)
+
+    def execute_sync(self, sql_text: str, params: Sequence[Any] = (), max_rows: Optional[int] = None,
+                     timeout: Optional[float] = None) -> QueryResult:
+        max_rows = self.max_rows if max_rows is None else max_rows
+        timeout = self.timeout if timeout is None else timeout
+        started = time.perf_counter()
+        with self.connection() as conn:
+            cur = conn.cursor()
+            conn.set_authorizer(read_only_authorizer)
+            try:
+                with self._deadline(conn, timeout):
+                    cur.execute(sql_text, params)
+                    columns = [d[0] for d in cur.description or []]
+                    rows: List[Dict[str, Any]] = []
+                    truncated = False
+                    # Fetch in batches and stop at the cap; rows past it are never produced
+                    while len(rows) < max_rows:
+                        batch = cur.fetchmany(min(FETCH_BATCH, max_rows - len(rows)))
+                        if not batch:
+                            break
+                        rows.extend(dict(zip(columns, row)) for row in batch)
+                    else:
+                        truncated = cur.fetchone() is not None
+            finally:
+                cur.close()
+                conn.set_authorizer(None)
+        return QueryResult(columns, rows, truncated, time.perf_counter() - started)
+
+    async def execute(self, sql_text: str, params: Sequence[Any] = (), max_rows: Optional[int] = None,
+                      timeout: Optional[float] = None) -> QueryResult:
+        return await self.run(self.execute_sync, sql_text, params, max_rows, timeout)
+
+    async def stream(self, sql_text: str, params: Sequence[Any] = (), batch_size: int = FETCH_BATCH,
+                     timeout: Optional[float] = None) -> AsyncIterator[Tuple[List[str], List[tuple]]]:
+        """
+        Yield `(columns, rows)` as rows are fetched: first `(columns, [])`, then one batch at a time.
+
+        Memory stays at one batch however large the result. The stream uses its own
+        connection rather than a pooled one, so a slow consumer never starves `execute`;
+        the timeout applies to each fetch.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        conn = await self.run(self.connect)
+        cur = conn.cursor()
+
+        def start() -> List[str]:
+            conn.set_authorizer(read_only_authorizer)
+            try:
+                with self._deadline(conn, timeout):
+                    cur.execute(sql_text, params)
+            finally:
+                conn.set_authorizer(None)
+            return [d[0] for d in cur.description or []]
+
+        def fetch() -> List[tuple]:
+            with self._deadline(conn, timeout):
+                return cur.fetchmany(batch_size)
+
+        try:
+            columns = await self.run(start)
+            yield columns, []
+            while True:
+                batch = await self.run(fetch)
+                if not batch:
+                    break
+                yield columns, batch
+        finally:
+            cur.close()
+            conn.close()
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run any blocking database work on the executor's threads."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
@@ -0,0 +1,210 @@
+# sql_generation.py
+import os
+import re
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from langchain.prompts import PromptTemplate
+
+from query_planner import PlanRejected
+from sql_guard import UnsafeSQL
+
+# Generation plus repairs per question
+SQL_MAX_ATTEMPTS = int(os.getenv("SQL_MAX_ATTEMPTS", "3"))
+# No repair is started once a question has taken this long
+SQL_REPAIR_BUDGET_SECONDS = float(os.getenv("SQL_REPAIR_BUDGET_SECONDS", "30"))
+
+PROMPT_TEMPLATE = """
+You are a SQL generator assistant for a SQLite database. Use the exact table schemas below to create a READ-ONLY SQL query (only SELECTs) that answers the user's question.
+Return **only the SQL** in a code block (triple backticks) or "NO_SQL" if not possible.
+
+Schema:
+{table_info}
+
+Instructions:
+- Do NOT output explanations.
+- Only SELECT, FROM, JOIN, WHERE, GROUP BY, ORDER BY, LIMIT.
+- Use ISO date format for date comparisons (YYYY-MM-DD).
+- When ambiguous, prefer safe SELECT with LIMIT 100.
+- If no data or unrelated question, respond "NO_SQL".
+
+User question:
+{user_question}
+"""
+
+REPAIR_TEMPLATE = """
+You are a SQL generator assistant for a SQLite database. The query below was written for the user's question but failed.
+Fix it using the exact table schemas below. Return **only the corrected SQL** in a code block (triple backticks) or "NO_SQL" if not possible.
+
+Schema:
+{table_info}
+
+Previous SQL:
+{sql}
+
+Error:
+{error}
+
+Instructions:
+- Do NOT output explanations.
+- Only a single read-only SELECT (WITH ... SELECT is allowed).
+- If the error says the query is too expensive, filter or aggregate more, or add a LIMIT.
+
+User question:
+{user_question}
+"""
+
+prompt = PromptTemplate(input_variables=["table_info", "user_question"], template=PROMPT_TEMPLATE)
+repair_prompt = PromptTemplate(input_variables=["table_info", "sql", "error", "user_question"], template=REPAIR_TEMPLATE)
+
+# Failures the model can be asked to fix; anything else (e.g. a timeout) ends the loop
+REPAIRABLE_ERRORS = (sqlite3.Error, UnsafeSQL, PlanRejected)
+
+
+def extract_sql(text: str) -> str:
+    m = re.search(r"```(?:sql)?\s*(.*?)```", text, flags=re.DOTALL | re.IGNORECASE)
+    if m:
+        return m.group(1).strip()
+    m2 = re.search(r"((?:with|select)\b.*)", text, flags=re.IGNORECASE | re.DOTALL)
+    return m2.group(1).strip() if m2 else ""
+
+
+def schema_excerpt(schema_text: str, sql_text: str, error: str) -> str:
+    """Schema blocks of the tables named in the failed SQL or its error (all of them if none match)."""
+    blocks = re.split(r"\n(?=Table )", schema_text)
+    mentioned = f"{sql_text}\n{error}".lower()
+    picked = []
+    for block in blocks:
+        m = re.match(r"Table (\S+):", block)
+        if m and re.search(rf"\b{re.escape(m.group(1).lower())}\b", mentioned):
+            picked.append(block)
+    return "\n".join(picked) if picked else schema_text
+
+
+@dataclass
+class Attempt:
+    number: int
+    sql: Optional[str]
+    error: Optional[str]
+    seconds: float
+
+
+@dataclass
+class GenerationOutcome:
+    sql: Optional[str]                    # last SQL tried (None when the model gave none)
+    value: Any                            # what `execute` returned for it, on success
+    attempts: List[Attempt] = field(default_factory=list)
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.sql is not None
+
+
+class AttemptStats:
+    """Success counts and timings per attempt number, over all questions."""
+
+    def __init__(self, max_attempts: int):
+        self.questions = 0
+        self.succeeded = 0
+        self.runs = [0] * max_attempts
+        self.successes = [0] * max_attempts
+        self.seconds = [0.0] * max_attempts
+
+    def record(self, outcome: GenerationOutcome) -> None:
+        self.questions += 1
+        self.succeeded += outcome.ok
+        for attempt in outcome.attempts:
+            i = attempt.number - 1
+            self.runs[i] += 1
+            self.successes[i] += attempt.error is None and attempt.sql is not None
+            self.seconds[i] += attempt.seconds
+
+    def stats(self) -> Dict[str, Any]:
+        first = self.successes[0] if self.successes else 0
+        return {
+            "questions": self.questions,
+            "success_at_1": first / self.questions if self.questions else 0.0,
+            "success_at_n": self.succeeded / self.questions if self.questions else 0.0,
+            "attempts": [
+                {"attempt": i + 1, "runs": runs, "success_rate": self.successes[i] / runs if runs else 0.0,
+                 "avg_seconds": self.seconds[i] / runs if runs else 0.0}
+                for i, runs in enumerate(self.runs)
+            ],
+        }
+
+
+class SQLGenerator:
+    """
+    Question -> SQL -> result, with bounded self-correction.
+
+    The first attempt asks the model for SQL; when running it fails with an error the
+    model can act on (SQLite error, safety rejection, plan over budget), the error and
+    the schema of the tables involved are sent back for a corrected query. At most
+    `max_attempts` attempts are made, and no repair starts after `budget_seconds`.
+    """
+
+    def __init__(self, llm, max_attempts: int = SQL_MAX_ATTEMPTS, budget_seconds: float = SQL_REPAIR_BUDGET_SECONDS):
+        self.llm = llm
+        self.max_attempts = max(1, max_attempts)
+        self.budget_seconds = budget_seconds
+        self.attempt_stats = AttemptStats(self.max_attempts)
+        # Chain with the schema already rendered into the prompt, so only the question varies per request
+        self.chain_for_schema = lru_cache(maxsize=4)(lambda table_info: prompt.partial(table_info=table_info) | llm)
+        self.repair_chain = repair_prompt | llm
+
+    async def generate(self, question: str, schema_text: str) -> str:
+        message = await self.chain_for_schema(schema_text).ainvoke({"user_question": question})
+        return extract_sql(message.content)
+
+    async def repair(self, question: str, schema_text: str, sql_text: str, error: str) -> str:
+        message = await self.repair_chain.ainvoke({
+            "table_info": schema_excerpt(schema_text, sql_text, error),
+            "sql": sql_text,
+            "error": error,
+            "user_question": question,
+        })
+        return extract_sql(message.content)
+
+    async def run(self, question: str, schema_text: str, execute: Callable[[str], Awaitable[Any]],
+                  sql_text: Optional[str] = None) -> GenerationOutcome:
+        """
+        Generate (unless `sql_text` is given, e.g. from the cache) and `execute` SQL,
+        repairing it on repairable errors. `execute` raises on failure.
+        """
+        started = time.perf_counter()
+        outcome = GenerationOutcome(None, None)
+        error = None
+        for number in range(1, self.max_attempts + 1):
+            if number > 1 and time.perf_counter() - started >= self.budget_seconds:
+                break
+            attempt_started = time.perf_counter()
+            if number == 1:
+                sql_text = sql_text or await self.generate(question, schema_text)
+            else:
+                sql_text = await self.repair(question, schema_text, sql_text, error)
+            if not sql_text or sql_text.upper() == "NO_SQL":
+                # The model says the question cannot be answered; asking again will not help
+                outcome.sql = outcome.error = None
+                outcome.attempts.append(Attempt(number, None, None, time.perf_counter() - attempt_started))
+                break
+            outcome.sql = sql_text
+            try:
+                outcome.value = await execute(sql_text)
+                outcome.error = None
+            except REPAIRABLE_ERRORS as e:
+                outcome.error = e
+                error = str(e)
+            except Exception as e:
+                outcome.error = e
+                outcome.attempts.append(Attempt(number, sql_text, str(e), time.perf_counter() - attempt_started))
+                break
+            outcome.attempts.append(Attempt(number, sql_text, error if outcome.error else None,
+                                            time.perf_counter() - attempt_started))
+            if outcome.error is None:
+                break
+        self.attempt_stats.record(outcome)
+        return outcome
@@ -0,0 +1,53 @@
+# sql_guard.py
+from typing import List
+
+from sqlparse import tokens as T
+from sqlparse.lexer import tokenize
+
+# Statements generated SQL may start with
+ALLOWED_FIRST_KEYWORDS = {"SELECT", "WITH"}
+
+
+class UnsafeSQL(ValueError):
+    pass
+
+
+def validate_sql(sql_text: str) -> str:
+    """
+    Check that `sql_text` is exactly one read-only SELECT (optionally WITH ... SELECT).
+
+    One pass over sqlparse's tokens: string literals and comments are whole tokens, so
+    `'--'` or `'update '` inside a value is fine, while a second statement, any DML other
+    than SELECT, DDL, or PRAGMA/ATTACH raises `UnsafeSQL`. Returns the statement without
+    comments or the trailing semicolon.
+    """
+    kept: List[str] = []
+    first = None
+    ended = False
+    for ttype, value in tokenize(sql_text):
+        if ttype in T.Comment:
+            kept.append(" ")
+            continue
+        if ttype in T.Whitespace or ttype in T.Newline:
+            kept.append(value)
+            continue
+        if ttype is T.Punctuation and value == ";":
+            ended = True
+            continue
+        if ended:
+            raise UnsafeSQL("only one SQL statement is allowed")
+        if ttype in T.Error:
+            raise UnsafeSQL(f"cannot parse SQL near {value!r}")
+        if first is None:
+            first = value.upper()
+            if first not in ALLOWED_FIRST_KEYWORDS:
+                raise UnsafeSQL(f"only SELECT queries are allowed, not {first}")
+        elif ttype in T.Keyword.DML and value.upper() != "SELECT":
+            raise UnsafeSQL(f"{value.upper()} is not allowed")
+        if ttype in T.Keyword.DDL:
+            raise UnsafeSQL(f"{value.upper()} is not allowed")
+        kept.append(value)
+    if first is None:
+        raise UnsafeSQL("empty SQL")
+    return "".join(kept).strip()
+
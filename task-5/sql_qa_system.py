@@ -1,14 +1,23 @@
+import json
 import os
-import re
 import sqlite3
-from typing import Any, Dict, List
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
 
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
+
+from analytics_engine import ANALYTICS_ENGINE, DuckDBAnalytics
+from pagination import InvalidCursor, clamp_page_size, decode_cursor, encode_cursor, page_sql
+from query_cache import QueryCache
+from query_planner import PlanRejected, QueryPlanner
+from schema_cache import SchemaCache, describe_schema, file_stamp
+from sql_guard import UnsafeSQL, validate_sql
+from sql_executor import QueryTimeout, ReadOnlyExecutor
+from sql_generation import SQLGenerator
 
 # ----------------------------
 # Load environment variables
@@ -33,107 +42,236 @@ app = FastAPI(title="Task-05 SQL QA - FastAPI")
 # Initialize Gemini LLM
 llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
 
-PROMPT_TEMPLATE = """
-You are a SQL generator assistant for a SQLite database. Use the exact table schemas below to create a READ-ONLY SQL query (only SELECTs) that answers the user's question. 
-Return **only the SQL** in a code block (triple backticks) or "NO_SQL" if not possible.
+# Pooled read-only connections; queries run on its threads, off the event loop
+sql_executor = ReadOnlyExecutor(DB_PATH)
+
+# Schema description (with keys, indexes and sample values), re-read only when the schema changes
+schema_cache = SchemaCache(DB_PATH, connect=sql_executor.connect)
 
-Schema:
-{table_info}
+# SQL generation with error-feedback repairs (SQL_MAX_ATTEMPTS, SQL_REPAIR_BUDGET_SECONDS)
+sql_generator = SQLGenerator(llm)
 
-Instructions:
-- Do NOT output explanations.
-- Only SELECT, FROM, JOIN, WHERE, GROUP BY, ORDER BY, LIMIT.
-- Use ISO date format for date comparisons (YYYY-MM-DD).
-- When ambiguous, prefer safe SELECT with LIMIT 100.
-- If no data or unrelated question, respond "NO_SQL".
+# Question -> SQL (per schema version) and SQL -> rows (per data version)
+query_cache = QueryCache()
 
-User question:
-{user_question}
-"""
+# EXPLAIN QUERY PLAN review before execution, plus the index recommendations it collects
+query_planner = QueryPlanner()
 
-prompt = PromptTemplate(input_variables=["table_info", "user_question"], template=PROMPT_TEMPLATE)
-chain = prompt | llm
+# Optional DuckDB snapshot for aggregate / sorting queries (ANALYTICS_ENGINE=duckdb); SQLite otherwise
+analytics = DuckDBAnalytics(DB_PATH, connect=sql_executor.connect) if ANALYTICS_ENGINE == "duckdb" else None
+
+def review_plan(sql_text: str):
+    with sql_executor.connection() as conn:
+        return query_planner.review(conn, sql_text)
 
 # ----------------------------
 # Safety checks
 # ----------------------------
-FORBIDDEN_TOKENS = ["drop ", "delete ", "update ", "alter ", "insert ", "create ", ";--", "--", "truncate "]
-
-def extract_sql(text: str) -> str:
-    m = re.search(r"```(?:sql)?\s*(.*?)```", text, flags=re.DOTALL | re.IGNORECASE)
-    if m:
-        return m.group(1).strip()
-    m2 = re.search(r"(select\b.*)", text, flags=re.IGNORECASE | re.DOTALL)
-    return m2.group(1).strip() if m2 else ""
-
 def is_safe_sql(sql_text: str) -> bool:
-    sql_lower = sql_text.lower()
-    return sql_lower.strip().startswith("select") and not any(tok in sql_lower for tok in FORBIDDEN_TOKENS)
+    """Single read-only SELECT, by tokenizing it (see sql_guard.validate_sql)."""
+    try:
+        validate_sql(sql_text)
+    except UnsafeSQL:
+        return False
+    return True
 
 def get_table_info_sqlite(db_path: str) -> str:
     conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    tables = []
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    for (tname,) in cur.fetchall():
-        if tname.startswith("sqlite_"):
-            continue
-        cur.execute(f"PRAGMA table_info('{tname}')")
-        cols = cur.fetchall()
-        col_strs = [f"{c[1]} {c[2]}" for c in cols]
-        tables.append(f"Table {tname}: ({', '.join(col_strs)})")
-    conn.close()
-    return "\n".join(tables)
-
-def run_sql(db_path: str, sql_text: str) -> List[Dict[str, Any]]:
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
     try:
-        cur.execute(sql_text)
-        rows = [dict(r) for r in cur.fetchall()]
+        return describe_schema(conn)
     finally:
         conn.close()
-    return rows
+
+def run_sql(db_path: str, sql_text: str) -> List[Dict[str, Any]]:
+    """Rows of a query on the shared read-only pool (capped at SQL_MAX_ROWS, bounded by SQL_TIMEOUT_SECONDS)."""
+    if db_path != sql_executor.db_path:
+        raise ValueError(f"No executor for {db_path}")
+    return sql_executor.execute_sync(sql_text).rows
 
 # ----------------------------
 # Request body
 # ----------------------------
 class QueryRequest(BaseModel):
     query: str
+    page_size: Optional[int] = None      # rows in the first page (SQL_PAGE_SIZE by default)
+
+class PageRequest(BaseModel):
+    cursor: str                          # next_cursor from /query or the previous page
+    page_size: Optional[int] = None
 
 # ----------------------------
 # FastAPI endpoints
 # ----------------------------
+def failure_response(user_q: str, outcome) -> Optional[Dict[str, Any]]:
+    """Response for a question whose SQL could not be generated or run, None when it succeeded."""
+    attempts = [asdict(a) for a in outcome.attempts]
+    if outcome.sql is None:
+        return {"query": user_q, "sql": None, "answer": "Cannot generate SQL for this question.", "attempts": attempts}
+
+    error = outcome.error
+    if isinstance(error, UnsafeSQL):
+        return {"query": user_q, "sql": outcome.sql, "answer": f"Generated SQL rejected by safety filter: {error}.",
+                "attempts": attempts}
+    if isinstance(error, PlanRejected):
+        return {"query": user_q, "sql": outcome.sql, "answer": f"{error}.",
+                "recommended_indexes": error.review.recommended_indexes, "attempts": attempts}
+    if isinstance(error, QueryTimeout):
+        return {"query": user_q, "sql": outcome.sql, "error": str(error), "timed_out": True, "attempts": attempts}
+    if error is not None:
+        return {"query": user_q, "sql": outcome.sql, "error": str(error), "attempts": attempts}
+    return None
+
+async def reviewed_sql(sql_text: str):
+    """Validated SQL and its plan review; raises UnsafeSQL / PlanRejected / sqlite3.Error for the repair loop."""
+    sql_text = validate_sql(sql_text)
+    # Too expensive by the query plan: run with a LIMIT, or refuse before touching the data
+    plan = await sql_executor.run(review_plan, sql_text)
+    if plan.rejected:
+        raise PlanRejected(plan)
+    return sql_text, plan
+
+async def fetch_page(sql_text: str, offset: int, page_size: int, data_version) -> Dict[str, Any]:
+    """
+    One page of rows from `offset`: from the rows cache when the full result is there, else
+    DuckDB or SQLite. A first page reads up to RESULT_CACHE_MAX_ROWS rows, so a result that
+    fits is cached whole and its later pages (of any size) are served from the cache.
+    A result cut short by the plan review's injected LIMIT is reported as truncated and
+    never cached.
+    """
+    rows = query_cache.get_rows(sql_text, data_version)
+    plan_note, engine, rows_cached, capped = None, "cache", rows is not None, False
+    if rows is not None:
+        rows, more = rows[offset:offset + page_size], len(rows) > offset + page_size
+    else:
+        fetch_rows = page_size if offset else max(page_size, query_cache.max_rows)
+        result, engine = None, "duckdb"
+        if analytics is not None and analytics.routes(sql_text, data_version):
+            try:
+                result = await sql_executor.run(analytics.execute_sync, validate_sql(sql_text), offset, fetch_rows)
+            except QueryTimeout:
+                raise
+            except Exception:
+                # DuckDB rejects some SQLite-valid SQL (e.g. bare columns next to GROUP BY): run it on SQLite
+                analytics.fallbacks += 1
+        if result is None:
+            engine = "sqlite"
+            sql_text, plan = await reviewed_sql(sql_text)
+            plan_note, capped = plan.reason, plan.rewritten
+            if offset:
+                result = await sql_executor.execute(page_sql(plan.sql), (offset,), max_rows=fetch_rows)
+            else:
+                result = await sql_executor.execute(plan.sql, max_rows=fetch_rows)
+        if not offset and not result.truncated and not capped:
+            # The whole result was read
+            query_cache.put_rows(sql_text, data_version, result.rows)
+        rows, more = result.rows[:page_size], result.truncated or len(result.rows) > page_size
+    # Past the injected LIMIT there is nothing to page to, but the result is still incomplete
+    return {"sql": sql_text, "rows": rows, "row_count": len(rows), "offset": offset, "truncated": more or capped,
+            "next_cursor": encode_cursor(sql_text, offset + len(rows)) if more else None,
+            "plan_note": plan_note, "engine": engine, "rows_cached": rows_cached}
+
 @app.post("/query")
 async def query_endpoint(req: QueryRequest):
     user_q = req.query.strip()
     if not user_q:
         return {"error": "Empty query"}
+    page_size = clamp_page_size(req.page_size)
+
+    schema = await sql_executor.run(schema_cache.get)
+    # A question asked before (against the same schema) reuses its SQL without calling Gemini
+    cached_sql = query_cache.get_sql(user_q, schema.version)
+    # Rows are reused until anything is written to the database
+    data_version = file_stamp(DB_PATH)
+
+    async def execute(sql_text: str) -> Dict[str, Any]:
+        return await fetch_page(validate_sql(sql_text), 0, page_size, data_version)
+
+    # Failed SQL goes back to Gemini with the error, up to SQL_MAX_ATTEMPTS times
+    outcome = await sql_generator.run(user_q, schema.text, execute, cached_sql)
+    failure = failure_response(user_q, outcome)
+    if failure:
+        return failure
 
-    table_info = get_table_info_sqlite(DB_PATH)
-    llm_input = {"table_info": table_info, "user_question": user_q}
-    sql_raw = chain.invoke(llm_input)
+    page = outcome.value
+    # Only SQL that ran is cached, so a failed generation is retried next time
+    query_cache.put_sql(user_q, schema.version, page["sql"])
+    sql_cached = cached_sql is not None and len(outcome.attempts) == 1
+    rows_cached = page.pop("rows_cached")
+    return {"query": user_q, **page, "attempts": [asdict(a) for a in outcome.attempts],
+            "cached": {"sql": sql_cached, "rows": rows_cached}}
 
-    # Query preparation
-    sql_text= str(sql_raw)
-    sql_candidate = extract_sql(sql_text)
-    sql_candidate = sql_candidate.encode().decode('unicode_escape')
-    
+@app.post("/query/page")
+async def page_endpoint(req: PageRequest):
+    """The page after a cursor: from the cached result when there is one, else re-run from that row offset."""
+    try:
+        sql_text, offset = decode_cursor(req.cursor)
+        page = await fetch_page(sql_text, offset, clamp_page_size(req.page_size), file_stamp(DB_PATH))
+    except InvalidCursor as e:
+        return {"error": str(e)}
+    except QueryTimeout as e:
+        return {"error": str(e), "timed_out": True}
+    except Exception as e:
+        return {"error": str(e)}
+    page.pop("rows_cached")
+    return page
+
+def ndjson(record: Dict[str, Any]) -> bytes:
+    return (json.dumps(record, default=str) + "\n").encode()
+
+@app.post("/query/stream")
+async def stream_endpoint(req: QueryRequest):
+    """
+    The whole result as NDJSON, sent while SQLite produces it: a "meta" line (SQL and
+    columns), "rows" lines of up to FETCH_BATCH rows, then an "end" (or "error") line.
+    Server memory stays at one batch whatever the result size.
+    """
+    user_q = req.query.strip()
+    if not user_q:
+        return {"error": "Empty query"}
 
-    if not sql_candidate or sql_candidate.upper() == "NO_SQL":
-        return {"query": user_q, "sql": None, "answer": "Cannot generate SQL for this question."}
+    schema = await sql_executor.run(schema_cache.get)
+    cached_sql = query_cache.get_sql(user_q, schema.version)
+    # Validation and EXPLAIN catch the errors worth a repair before the first row is sent
+    outcome = await sql_generator.run(user_q, schema.text, reviewed_sql, cached_sql)
+    failure = failure_response(user_q, outcome)
+    if failure:
+        return failure
+    sql_text, plan = outcome.value
 
-    if is_safe_sql(sql_candidate):
+    async def lines():
+        row_count = 0
         try:
-            rows = run_sql(DB_PATH, sql_candidate)
+            async for columns, rows in sql_executor.stream(plan.sql):
+                if not rows:
+                    yield ndjson({"type": "meta", "query": user_q, "sql": sql_text, "columns": columns,
+                                  "plan_note": plan.reason, "attempts": [asdict(a) for a in outcome.attempts]})
+                    continue
+                row_count += len(rows)
+                yield ndjson({"type": "rows", "rows": rows})
         except Exception as e:
-            return {"query": user_q, "sql": sql_candidate, "error": str(e)}
-        return {"query": user_q, "sql": sql_candidate, "rows": rows, "row_count": len(rows)}
-    else:
-        return {"query": user_q, "sql": sql_candidate, "answer": "Generated SQL rejected by safety filter."}
+            yield ndjson({"type": "error", "error": str(e), "timed_out": isinstance(e, QueryTimeout)})
+            return
+        query_cache.put_sql(user_q, schema.version, sql_text)
+        yield ndjson({"type": "end", "row_count": row_count, "truncated": plan.rewritten})
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return query_cache.stats()
+
+@app.get("/analytics/stats")
+async def analytics_stats():
+    return analytics.stats() if analytics is not None else {"engine": "sqlite"}
+
+@app.get("/generation/stats")
+async def generation_stats():
+    return sql_generator.attempt_stats.stats()
 
-    
+@app.get("/indexes/recommended")
+async def recommended_indexes():
+    return query_planner.report()
 
 @app.get("/")
 async def root():
@@ -9,6 +9,11 @@ load_dotenv()
 
 API_URL = os.getenv("LOCAL_API_URL", "http://localhost:8000/query")
 os.environ["API_URL"] = API_URL
+# LOCAL_API_URL may be the server root or its /query endpoint
+API_ROOT = API_URL.rstrip("/").removesuffix("/query")
+# Seconds to wait for the API (SQL generation plus the first page)
+API_TIMEOUT_SECONDS = float(os.getenv("API_TIMEOUT_SECONDS", "120"))
+PAGE_SIZE = int(os.getenv("SQL_PAGE_SIZE", "500"))
 
 st.set_page_config(page_title="SQL QA Demo", layout="wide")
 st.title("SQL QA Demo — Task 05")
@@ -24,26 +29,65 @@ user_input = st.text_input("Ask a question about campaigns/customers/leads (exam
 
 q = user_input if user_input else selected_query
 
+def post(path, payload):
+    resp = requests.post(API_ROOT + path, json=payload, timeout=API_TIMEOUT_SECONDS)
+    if resp.status_code != 200:
+        raise RuntimeError(f"API error: {resp.status_code} - {resp.text}")
+    return resp.json()
+
+def load_more():
+    """Fetch the next page and append it to the rows already shown."""
+    result = st.session_state.result
+    try:
+        page = post("/query/page", {"cursor": result["next_cursor"], "page_size": PAGE_SIZE})
+    except Exception as e:
+        st.session_state.page_error = str(e)
+        return
+    if page.get("error"):
+        st.session_state.page_error = page["error"]
+        return
+    result["rows"].extend(page.get("rows", []))
+    result["next_cursor"] = page.get("next_cursor")
+
 if st.button("Run Query"):
     if not q.strip():
         st.warning("Please type a question.")
     else:
+        st.session_state.pop("page_error", None)
         with st.spinner("Querying..."):
-            resp = requests.post(API_URL, json={"query": q})
-            if resp.status_code == 200:
-                try:
-                    data = resp.json()
-                    st.subheader("Generated Sql")
-                    st.code(data.get("sql") or "No Sql generated", language= "sql")
-                    st.subheader("Result")
-                    rows = data.get("rows", [])
-                    if not rows:
-                        st.write("No rows returned")
-                    else:
-                        st.dataframe(rows)
-                    st.write(f"Row count: {data.get('row_count', 0)}")
-                except Exception as e:
-                    st.error(f"Response is not valid Json: {e}")
-            else:
-                st.error(f"API error: {resp.status_code} - {resp.text}")
-            
\ No newline at end of file
+            try:
+                # Only the first page comes back; the rest is fetched on demand
+                st.session_state.result = post("/query", {"query": q, "page_size": PAGE_SIZE})
+            except requests.Timeout:
+                st.session_state.pop("result", None)
+                st.error(f"The API did not answer within {API_TIMEOUT_SECONDS:g}s.")
+            except ValueError as e:
+                st.session_state.pop("result", None)
+                st.error(f"Response is not valid Json: {e}")
+            except Exception as e:
+                st.session_state.pop("result", None)
+                st.error(str(e))
+
+data = st.session_state.get("result")
+if data:
+    st.subheader("Generated Sql")
+    st.code(data.get("sql") or "No Sql generated", language= "sql")
+    if data.get("answer") or data.get("error"):
+        st.warning(data.get("answer") or data.get("error"))
+    st.subheader("Result")
+    rows = data.get("rows", [])
+    if not rows:
+        st.write("No rows returned")
+    else:
+        st.dataframe(rows)
+    more = " (more available)" if data.get("next_cursor") else " (truncated)" if data.get("truncated") else ""
+    st.write(f"Row count: {len(rows)}{more}")
+    if data.get("plan_note"):
+        st.caption(f"Query plan: {data['plan_note']}")
+    if data.get("next_cursor"):
+        st.button(f"Load {PAGE_SIZE} more rows", on_click=load_more)
+    if st.session_state.get("page_error"):
+        st.error(st.session_state.pop("page_error"))
+    cached = data.get("cached") or {}
+    if cached.get("sql") or cached.get("rows"):
+        st.caption(f"Served from cache: SQL {'yes' if cached.get('sql') else 'no'}, rows {'yes' if cached.get('rows') else 'no'}")
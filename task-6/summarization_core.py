@@ -1,11 +1,11 @@
 # task-6/summarization_core.py
 import os
+import sys
 import time
 import asyncio
 import operator
 from typing import Annotated, List, Literal, TypedDict
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
 from langchain_google_genai import GoogleGenerativeAI
 from langchain_community.document_loaders import WebBaseLoader
 from langchain.text_splitter import CharacterTextSplitter
@@ -17,6 +17,9 @@ from langgraph.constants import Send
 from langgraph.graph import END, START, StateGraph
 from google.api_core.exceptions import ResourceExhausted
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.pdf_extraction import load_pdf_text
+
 # ----------------------------
 # Load environment
 # ----------------------------
@@ -28,12 +31,7 @@ os.environ["api_key"] = api_key
 # PDF Loader Helper
 # ----------------------------
 def load_pdf(files):
-    text = ""
-    for file in files:
-        pdf = PdfReader(file)
-        for page in pdf.pages:
-            text += page.extract_text()
-    return text
+    return "".join(load_pdf_text(file) for file in files)
 
 # ----------------------------
 # Core Summarization Logic